@@ -0,0 +1,207 @@
+"""
+Benchmarks for each stage of the pipeline
+
+Times, and separately measures the peak memory (via `tracemalloc`) of:
+- `dictionary-compile` and `dictionary-open`: `lexicon.load` without, then
+  with, the prebuilt index,
+- `analysis`: the Chinese analyzer (uncached),
+- `lookup`: building one morpheme per analyzer token with its dictionary hits,
+- `merge`: `parse.mergeDictionaryRuns`,
+- `guess`: `parse.guessMissingReadings`,
+- `wordfill`: splitting every multi-character token with a `wordfill.Segmenter`,
+- `render`: `morphemeToRuby` and `morphemeToBulletedDefs` over every morpheme,
+
+for synthetic texts (see `synthetic.py`) of each requested size. Everything
+runs offline against the small fixture dictionaries in `fixtures/`, inside a
+temporary directory, so no downloaded dictionaries or caches are touched.
+
+Results are written as JSON:
+```
+{"version": 1, "python": ..., "platform": ..., "time": ...,
+ "results": [{"stage": "merge", "bytes": 1024, "items": 300, "seconds": 0.001, "peakBytes": 5000}, ...]}
+```
+Usage:
+```
+python benchmarks/bench.py --sizes 1K,10K,100K,1M,10M --out bench.json
+```
+"""
+
+import contextlib
+import copy
+import json
+import os
+import os.path
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+from synthetic import CCCANTO_FIXTURE, READINGS_FIXTURE, parseSize, syntheticText
+
+VERSION = 1
+DEFAULT_SIZES = '1K,10K,100K,1M,10M'
+# names `parse` expects the dictionaries to have, in the current directory
+CCCANTO_FILE = 'cccanto-webdist.txt'
+READINGS_FILE = 'cccedict-canto-readings-150923.txt'
+INDEX_FILE = 'cantopolitan.bin'
+T = typing.TypeVar('T')
+
+
+class Result(typing.TypedDict):
+  stage: str
+  bytes: int  # size of the input text; 0 for stages that don't take text
+  items: int  # how many things (tokens, morphemes, words) the stage processed
+  seconds: float
+  peakBytes: int
+
+
+def measure(run: typing.Callable[[T], typing.Any],
+            setup: typing.Callable[[], T]) -> tuple[typing.Any, float, int]:
+  """Run `run(setup())` twice: once timed, once under `tracemalloc`
+
+  `setup` isn't measured, and is called afresh for each run so stages that
+  mutate their input see the same input both times. Returns the result of the
+  timed run, its duration, and the peak memory allocated by the second run.
+  """
+  arg = setup()
+  start = time.perf_counter()
+  result = run(arg)
+  seconds = time.perf_counter() - start
+
+  arg = setup()
+  tracemalloc.start()
+  try:
+    run(arg)
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  return result, seconds, peak
+
+
+def benchDictionaries(results: list[Result]):
+  import lexicon
+
+  def load(_):
+    index = lexicon.load(INDEX_FILE, CCCANTO_FILE, READINGS_FILE)
+    items = len(index.store)
+    index.close()
+    return items
+
+  def removeIndex():
+    if os.path.exists(INDEX_FILE):
+      os.remove(INDEX_FILE)
+
+  items, seconds, peak = measure(load, removeIndex)
+  results.append(
+      Result(stage='dictionary-compile', bytes=0, items=items, seconds=seconds, peakBytes=peak))
+  items, seconds, peak = measure(load, lambda: None)
+  results.append(
+      Result(stage='dictionary-open', bytes=0, items=items, seconds=seconds, peakBytes=peak))
+
+
+def benchText(size: int, results: list[Result]):
+  import parse
+  from wordfill import Segmenter
+
+  text = syntheticText(size)
+  size = len(text.encode('utf8'))
+  pipeline = parse.Pipeline(cacheFile=None)
+
+  def record(stage: str, items: int, seconds: float, peak: int):
+    results.append(Result(stage=stage, bytes=size, items=items, seconds=seconds, peakBytes=peak))
+    print(f'{stage:>10} {size:>10} B {seconds:10.4f} s {peak / 1e6:10.2f} MB', file=sys.stderr)
+
+  analysis, seconds, peak = measure(pipeline.analyze, lambda: text)
+  tokens = analysis.tokens()
+  record('analysis', len(tokens), seconds, peak)
+
+  morphemes, seconds, peak = measure(pipeline.tokenMorphemes, lambda: analysis)
+  record('lookup', len(morphemes), seconds, peak)
+
+  merged, seconds, peak = measure(lambda ms: parse.mergeDictionaryRuns(ms, pipeline.lexicon),
+                                  lambda: copy.deepcopy(morphemes))
+  record('merge', len(morphemes), seconds, peak)
+
+  guessed, seconds, peak = measure(lambda ms: parse.guessMissingReadings(ms, pipeline.lexicon),
+                                   lambda: copy.deepcopy(merged))
+  record('guess', len(merged), seconds, peak)
+
+  words = [token for token in tokens if len(token) > 1]
+
+  def fillAll(segmenter: Segmenter):
+    for word in words:
+      try:
+        segmenter.segment(word)
+      except ValueError:
+        pass
+
+  _, seconds, peak = measure(fillAll, lambda: Segmenter(pipeline.lexicon))
+  record('wordfill', len(words), seconds, peak)
+
+  def render(ms: list[parse.Morpheme]):
+    for m in ms:
+      parse.morphemeToRuby(m)
+      parse.morphemeToBulletedDefs(m)
+
+  _, seconds, peak = measure(render, lambda: guessed)
+  record('render', len(guessed), seconds, peak)
+
+
+@contextlib.contextmanager
+def fixtureDirectory() -> typing.Iterator[str]:
+  "Work in a temporary directory holding the fixture dictionaries, named as `parse` expects"
+  cwd = os.getcwd()
+  with tempfile.TemporaryDirectory() as workdir:
+    shutil.copy(CCCANTO_FIXTURE, os.path.join(workdir, CCCANTO_FILE))
+    shutil.copy(READINGS_FIXTURE, os.path.join(workdir, READINGS_FILE))
+    os.chdir(workdir)
+    try:
+      yield workdir
+    finally:
+      os.chdir(cwd)
+
+
+def report(version: int, results: list, **fields) -> dict:
+  "A benchmark's JSON report: its format `version`, where and when it ran, `fields`, and `results`"
+  return dict(
+      version=version,
+      python=platform.python_version(),
+      platform=platform.platform(),
+      time=time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+      **fields,
+      results=results)
+
+
+def writeReport(report: dict, out: typing.Optional[str] = None):
+  "Write a JSON report to the file `out`, or to stdout"
+  if out:
+    with open(out, 'w') as fid:
+      json.dump(report, fid, indent=1)
+  else:
+    print(json.dumps(report, indent=1))
+
+
+def main(sizes: list[int]) -> dict:
+  results: list[Result] = []
+  with fixtureDirectory():
+    benchDictionaries(results)
+    for size in sizes:
+      benchText(size, results)
+  return report(VERSION, results)
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Benchmark each pipeline stage, printing JSON")
+  parser.add_argument(
+      '--sizes',
+      default=DEFAULT_SIZES,
+      help=f"comma-separated text sizes (default: {DEFAULT_SIZES})")
+  parser.add_argument('--out', help="write JSON here instead of stdout")
+  args = parser.parse_args()
+
+  writeReport(main([parseSize(s) for s in args.sizes.split(',')]), args.out)
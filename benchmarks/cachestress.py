@@ -0,0 +1,126 @@
+"""
+Stress test for the analysis cache with concurrent writers
+
+For each requested number of writers `N`, starts `N` processes that all open
+one fresh `cache_analysis.AnalysisCache` (creating its shards concurrently)
+and each, at the same time, caches `--entries` results of `--bytes` bytes
+(flushing every `--flush-every`), while also looking up the other writers'
+texts. Afterwards, checks that every
+writer's every result is in the cache, intact. Prints JSON:
+```
+{"version": 1, "python": ..., "platform": ..., "time": ...,
+ "results": [{"writers": 4, "entries": 8000, "lost": 0, "corrupt": 0, "lookups": 8000, "hits": 3000,
+              "seconds": 1.2, "entriesPerSecond": 6600.0}, ...]}
+```
+Usage:
+```
+python benchmarks/cachestress.py --writers 1,2,4,8 --entries 2000
+```
+"""
+
+import multiprocessing
+import os
+import os.path
+import random
+import sys
+import tempfile
+import time
+import typing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import report, writeReport
+from cache_analysis import AnalysisCache
+
+VERSION = 1
+DEFAULT_WRITERS = '1,2,4,8'
+
+
+def text(writer: int, i: int) -> str:
+  return f'writer {writer} text {i}'
+
+
+def data(writer: int, i: int, size: int) -> bytes:
+  return random.Random(f'{writer} {i}').randbytes(size)
+
+
+def write(job: tuple[str, int, int, int, int, int, typing.Any]) -> tuple[int, int]:
+  "Cache one writer's results, looking up others' along the way: returns lookups and hits"
+  cacheDir, writer, writers, entries, size, flushEvery, barrier = job
+  cache = AnalysisCache(cacheDir, None, flushEvery=flushEvery, maxEntries=None)
+  rand = random.Random(writer)
+  lookups = hits = 0
+  barrier.wait()
+  for i in range(entries):
+    cache.setData(text(writer, i), data(writer, i, size))
+    lookups += 1
+    hits += cache.getData(text(rand.randrange(writers), rand.randrange(entries))) is not None
+  cache.close()
+  return lookups, hits
+
+
+def stress(writers: int, entries: int, size: int, flushEvery: int) -> dict:
+  with tempfile.TemporaryDirectory() as tmp:
+    cacheDir = os.path.join(tmp, 'cache')
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Manager().Barrier(writers + 1)
+    with context.Pool(writers) as pool:
+      jobs = [(cacheDir, w, writers, entries, size, flushEvery, barrier) for w in range(writers)]
+      pending = pool.map_async(write, jobs)
+      barrier.wait()  # start the clock once every writer is ready
+      start = time.perf_counter()
+      counts = pending.get()
+      seconds = time.perf_counter() - start
+
+    cache = AnalysisCache(cacheDir, None, maxEntries=None)
+    lost = corrupt = 0
+    for w in range(writers):
+      for i in range(entries):
+        found = cache.getData(text(w, i))
+        lost += found is None
+        corrupt += found is not None and found != data(w, i, size)
+    cache.close()
+
+  total = writers * entries
+  return dict(
+      writers=writers,
+      entries=total,
+      lost=lost,
+      corrupt=corrupt,
+      lookups=sum(lookups for lookups, _ in counts),
+      hits=sum(hits for _, hits in counts),
+      seconds=seconds,
+      entriesPerSecond=total / seconds)
+
+
+def main(writers: list[int], entries: int, size: int, flushEvery: int) -> dict:
+  results = []
+  for n in writers:
+    result = stress(n, entries, size, flushEvery)
+    results.append(result)
+    print(
+        f'{n:>3} writers {result["entriesPerSecond"]:10.0f} entries/s, {result["lost"]} lost, '
+        f'{result["corrupt"]} corrupt',
+        file=sys.stderr)
+  return report(VERSION, results)
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Stress the analysis cache with concurrent writers")
+  parser.add_argument(
+      '--writers',
+      default=DEFAULT_WRITERS,
+      help=f"comma-separated numbers of writer processes (default: {DEFAULT_WRITERS})")
+  parser.add_argument(
+      '--entries', type=int, default=2000, help="results per writer (default: 2000)")
+  parser.add_argument('--bytes', type=int, default=2000, help="bytes per result (default: 2000)")
+  parser.add_argument(
+      '--flush-every', type=int, default=100, help="results per flush (default: 100)")
+  parser.add_argument('--out', help="write JSON here instead of stdout")
+  args = parser.parse_args()
+
+  writeReport(
+      main([int(n) for n in args.writers.split(',')], args.entries, args.bytes, args.flush_every),
+      args.out)
@@ -0,0 +1,106 @@
+"""
+Compare `parse.py`'s segmentation engines
+
+Parses synthetic texts (see `synthetic.py`) of each requested size with each
+`parse.ENGINES` pipeline, timing them, and measures how closely the
+dictionary engine's output agrees with the Chinese analyzer's:
+- `spanF1`: F1 score of the visible (not `hidden`) morphemes' spans, with the
+  analyzer's as reference: 1.0 means the texts were split identically,
+- `rubyAgreement`: of the spans both engines found, the fraction whose
+  `parse.morphemeToRuby` is the same.
+
+Like `bench.py`, runs offline against the fixture dictionaries, in a
+temporary directory. Prints JSON:
+```
+{"version": 1, "python": ..., "platform": ..., "time": ...,
+ "results": [{"bytes": 1024, "seconds": {"analyzer": 0.05, "dictionary": 0.01},
+              "morphemes": {"analyzer": 300, "dictionary": 290},
+              "spanF1": 0.9, "rubyAgreement": 0.95}]}
+```
+Usage:
+```
+python benchmarks/engines.py --sizes 1K,100K,1M --out engines.json
+```
+"""
+
+import time
+
+from bench import fixtureDirectory, report, writeReport
+from synthetic import parseSize, syntheticText
+
+VERSION = 1
+DEFAULT_SIZES = '1K,10K,100K,1M'
+
+
+def visibleSpans(morphemes: list) -> dict[tuple[int, int], dict]:
+  "Each visible morpheme by its `(start, end)` in the text"
+  spans: dict[tuple[int, int], dict] = dict()
+  start = 0
+  for m in morphemes:
+    if m['hidden']:
+      continue
+    end = start + len(m['hanzi'])
+    spans[(start, end)] = m
+    start = end
+  return spans
+
+
+def agreement(reference: list, candidate: list) -> tuple[float, float]:
+  "Span F1 and ruby agreement of `candidate` morphemes against `reference` ones"
+  import parse
+
+  expected = visibleSpans(reference)
+  actual = visibleSpans(candidate)
+  shared = expected.keys() & actual.keys()
+  if not shared:
+    return 0.0, 0.0
+  precision = len(shared) / len(actual)
+  recall = len(shared) / len(expected)
+  f1 = 2 * precision * recall / (precision + recall)
+  same = sum(
+      parse.morphemeToRuby(expected[span]) == parse.morphemeToRuby(actual[span]) for span in shared)
+  return f1, same / len(shared)
+
+
+def compare(size: int) -> dict:
+  import parse
+
+  text = syntheticText(size)
+  seconds: dict[str, float] = dict()
+  outputs: dict[str, list] = dict()
+  for engine in parse.ENGINES:
+    with parse.Pipeline(cacheFile=None, engine=engine) as pipeline:
+      start = time.perf_counter()
+      outputs[engine] = pipeline.parse(text)
+      seconds[engine] = time.perf_counter() - start
+  f1, ruby = agreement(outputs['analyzer'], outputs['dictionary'])
+  return dict(
+      bytes=len(text.encode('utf8')),
+      seconds=seconds,
+      morphemes={
+          engine: len(morphemes) for engine, morphemes in outputs.items()
+      },
+      spanF1=f1,
+      rubyAgreement=ruby)
+
+
+def main(sizes: list[int]) -> dict:
+  results: list[dict] = []
+  with fixtureDirectory():
+    for size in sizes:
+      results.append(compare(size))
+  return report(VERSION, results)
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Compare segmentation engines, printing JSON")
+  parser.add_argument(
+      '--sizes',
+      default=DEFAULT_SIZES,
+      help=f"comma-separated text sizes (default: {DEFAULT_SIZES})")
+  parser.add_argument('--out', help="write JSON here instead of stdout")
+  args = parser.parse_args()
+
+  writeReport(main([parseSize(s) for s in args.sizes.split(',')]), args.out)
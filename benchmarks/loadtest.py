@@ -0,0 +1,109 @@
+"""
+Load test for `parse_server.py`
+
+Starts `--clients` threads that each POST synthetic texts (see `synthetic.py`)
+of `--size` bytes to a running parse server, back to back, for `--seconds`.
+Texts are drawn from a pool of `--distinct` different texts, so a small pool
+exercises the analysis cache and a large one the analyzer. Prints JSON with
+throughput and latency percentiles:
+```
+{"version": 1, "url": ..., "clients": 8, "requests": 1200, "errors": 0, "seconds": 10.0,
+ "requestsPerSecond": 120.0, "latency": {"mean": 0.06, "p50": 0.05, "p95": 0.1, "p99": 0.2, "max": 0.3}}
+```
+Usage, with the fixture dictionaries in the server's directory:
+```
+python parse_server.py --port 5001 &
+python benchmarks/loadtest.py --url http://127.0.0.1:5001/parse --clients 8 --seconds 10
+```
+"""
+
+import random
+import sys
+import threading
+import time
+import urllib.request
+
+from bench import writeReport
+from synthetic import parseSize, syntheticText
+
+VERSION = 1
+
+
+def post(url: str, text: str) -> bytes:
+  req = urllib.request.Request(
+      url, data=text.encode('utf8'), headers={'Content-Type': 'text/plain; charset=utf-8'})
+  with urllib.request.urlopen(req) as response:
+    return response.read()
+
+
+def percentile(sortedValues: list[float], p: float) -> float:
+  if not sortedValues:
+    return 0.0
+  return sortedValues[min(len(sortedValues) - 1, int(p / 100 * len(sortedValues)))]
+
+
+def loadTest(url: str, clients: int, seconds: float, size: int, distinct: int) -> dict:
+  texts = [syntheticText(size, seed=seed) for seed in range(distinct)]
+  latencies: list[float] = []
+  errors = 0
+  lock = threading.Lock()
+  deadline = time.monotonic() + seconds
+
+  def client(seed: int):
+    nonlocal errors
+    rand = random.Random(seed)
+    while time.monotonic() < deadline:
+      start = time.perf_counter()
+      try:
+        post(url, rand.choice(texts))
+      except OSError as e:
+        with lock:
+          errors += 1
+        print(f'error: {e}', file=sys.stderr)
+        continue
+      elapsed = time.perf_counter() - start
+      with lock:
+        latencies.append(elapsed)
+
+  threads = [threading.Thread(target=client, args=(seed,)) for seed in range(clients)]
+  start = time.monotonic()
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  elapsed = time.monotonic() - start
+
+  latencies.sort()
+  return dict(
+      version=VERSION,
+      url=url,
+      clients=clients,
+      textBytes=size,
+      distinctTexts=distinct,
+      requests=len(latencies),
+      errors=errors,
+      seconds=elapsed,
+      requestsPerSecond=len(latencies) / elapsed,
+      latency=dict(
+          mean=sum(latencies) / len(latencies) if latencies else 0.0,
+          p50=percentile(latencies, 50),
+          p95=percentile(latencies, 95),
+          p99=percentile(latencies, 99),
+          max=latencies[-1] if latencies else 0.0))
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Load test a running parse server, printing JSON")
+  parser.add_argument('--url', default='http://127.0.0.1:5001/parse')
+  parser.add_argument('--clients', type=int, default=8, help="concurrent clients (default: 8)")
+  parser.add_argument('--seconds', type=float, default=10, help="how long to run (default: 10)")
+  parser.add_argument('--size', default='1K', help="bytes per text, e.g., 200, 1K (default: 1K)")
+  parser.add_argument(
+      '--distinct', type=int, default=100, help="how many different texts to send (default: 100)")
+  parser.add_argument('--out', help="write JSON here instead of stdout")
+  args = parser.parse_args()
+
+  writeReport(
+      loadTest(args.url, args.clients, args.seconds, parseSize(args.size), args.distinct), args.out)
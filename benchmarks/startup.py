@@ -0,0 +1,101 @@
+"""
+Startup-time benchmark
+
+Times fresh Python processes (median and fastest of `--runs`) that:
+- `interpreter`: do nothing, as a baseline,
+- `import-render`: import `render`, which should load no dictionaries,
+- `parsed_to_md`: render a small parsed document to Markdown,
+- `import-parse`: import `parse`, which should load nothing yet either,
+- `parse-dictionary` and `parse-analyzer`: parse a small text with each engine,
+  from the prebuilt index.
+
+and lists any of `HEAVY_MODULES` that importing `render` and `parsed_to_md`
+pulled in, which should be none. Like `bench.py`, runs offline against the
+fixture dictionaries, in a temporary directory. Prints JSON:
+```
+{"version": 1, "python": ..., "platform": ..., "time": ..., "renderImports": [],
+ "results": [{"case": "parsed_to_md", "runs": 10, "median": 0.05, "min": 0.04}, ...]}
+```
+Usage:
+```
+python benchmarks/startup.py --runs 20 --out startup.json
+```
+"""
+
+import json
+import os
+import os.path
+import statistics
+import subprocess
+import sys
+import time
+import typing
+
+from bench import CCCANTO_FILE, INDEX_FILE, READINGS_FILE, fixtureDirectory, report, writeReport
+from synthetic import syntheticText
+
+VERSION = 1
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ('chinese', 'jieba', 'lexicon', 'parse')
+TEXT_BYTES = 1024
+
+
+class Case(typing.NamedTuple):
+  name: str
+  args: list[str]  # for the Python interpreter
+  stdin: str = ''
+
+
+def run(args: list[str], stdin: str = '') -> str:
+  path = os.pathsep.join(filter(None, [REPO, os.environ.get('PYTHONPATH')]))
+  env = dict(os.environ, PYTHONPATH=path)
+  return subprocess.run(
+      [sys.executable] + args, input=stdin, capture_output=True, text=True, check=True,
+      env=env).stdout
+
+
+def timeCase(case: Case, runs: int) -> dict:
+  seconds: list[float] = []
+  for _ in range(runs):
+    start = time.perf_counter()
+    run(case.args, case.stdin)
+    seconds.append(time.perf_counter() - start)
+  return dict(case=case.name, runs=runs, median=statistics.median(seconds), min=min(seconds))
+
+
+def main(runs: int) -> dict:
+  with fixtureDirectory():
+    import lexicon
+    lexicon.load(INDEX_FILE, CCCANTO_FILE, READINGS_FILE).close()  # prebuild it
+    text = syntheticText(TEXT_BYTES)
+    document = run([os.path.join(REPO, 'parse.py'), '--engine', 'dictionary'], text)
+
+    renderImports = json.loads(
+        run([
+            '-c', 'import json, sys, render, parsed_to_md; '
+            f'print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))'
+        ]))
+    cases = [
+        Case('interpreter', ['-c', 'pass']),
+        Case('import-render', ['-c', 'import render']),
+        Case('parsed_to_md', [os.path.join(REPO, 'parsed_to_md.py')], document),
+        Case('import-parse', ['-c', 'import parse']),
+        Case('parse-dictionary', [os.path.join(REPO, 'parse.py'), '--engine', 'dictionary'], text),
+        Case('parse-analyzer', [os.path.join(REPO, 'parse.py')], text),
+    ]
+    results = []
+    for case in cases:
+      results.append(timeCase(case, runs))
+      print(f'{case.name:>16} {results[-1]["median"]:8.4f} s', file=sys.stderr)
+  return report(VERSION, results, renderImports=renderImports)
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Time how long entry points take to start")
+  parser.add_argument('--runs', type=int, default=10, help="runs per case (default: 10)")
+  parser.add_argument('--out', help="write JSON here instead of stdout")
+  args = parser.parse_args()
+
+  writeReport(main(args.runs), args.out)
@@ -0,0 +1,78 @@
+"""
+Synthetic Cantonese text for benchmarks
+
+Strings together words from the fixture dictionaries, plus some characters
+that aren't in them (so readings have to be guessed, or are missing), with
+punctuation, line breaks and paragraph breaks, until the text reaches a given
+size in UTF-8 bytes. The same size and seed always give the same text.
+"""
+
+import os.path
+import random
+import sys
+import typing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+
+import cccanto
+import readings
+
+FIXTURES = os.path.join(HERE, 'fixtures')
+CCCANTO_FIXTURE = os.path.join(FIXTURES, 'cccanto-fixture.txt')
+READINGS_FIXTURE = os.path.join(FIXTURES, 'readings-fixture.txt')
+
+# common characters missing from the fixtures
+UNKNOWN = list('哋咁嘢噉嚟啲喇咩啩嘞囉攞畀諗嬲瞓')
+PUNCTUATION = list('，，，。。！？、')
+
+
+def vocabulary() -> list[str]:
+  "Headwords of both fixture dictionaries"
+  words = set(cccanto.parseFile(CCCANTO_FIXTURE)[0]) | set(readings.parseFile(READINGS_FIXTURE)[0])
+  return sorted(words)
+
+
+def syntheticText(size: int, seed: int = 0, words: typing.Optional[list[str]] = None) -> str:
+  "About `size` bytes (UTF-8) of text, never more"
+  rand = random.Random(seed)
+  words = words or vocabulary()
+  pieces: list[str] = []
+  total = 0
+  while True:
+    r = rand.random()
+    if r < 0.75:
+      piece = rand.choice(words)
+    elif r < 0.85:
+      piece = rand.choice(UNKNOWN)
+    elif r < 0.97:
+      piece = rand.choice(PUNCTUATION)
+    elif r < 0.995:
+      piece = '\n'
+    else:
+      piece = '\n\n'
+    length = len(piece.encode('utf8'))
+    if total + length > size:
+      break
+    pieces.append(piece)
+    total += length
+  return "".join(pieces)
+
+
+def parseSize(s: str) -> int:
+  "`'10K'` -> 10240, `'1M'` -> 1048576, `'123'` -> 123"
+  units = {'K': 1024, 'M': 1024**2, 'G': 1024**3}
+  s = s.strip().upper().removesuffix('B')
+  if s and s[-1] in units:
+    return int(float(s[:-1]) * units[s[-1]])
+  return int(s)
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Print synthetic Cantonese text")
+  parser.add_argument('size', help="size in bytes, e.g., 1000, 10K, 10M")
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+  sys.stdout.write(syntheticText(parseSize(args.size), seed=args.seed))
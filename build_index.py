@@ -0,0 +1,42 @@
+"""
+Build the prebuilt dictionary index ahead of time
+
+`parse.py` needs one file at startup, the prebuilt index (see
+`lexicon.build`), which holds both dictionaries' entries and the prefix index
+over their headwords, stamped with a checksum of the text dictionaries and the
+index format version. `parse.py` builds it itself the first time it runs, and
+again whenever the text dictionaries change, but building it explicitly lets a
+deployment (e.g., a container image) ship it, so nothing is parsed at startup
+and the text dictionaries needn't be shipped at all.
+
+Usage:
+```
+python build_index.py
+CANTOPOLITAN_INDEX=/srv/cantopolitan.bin python build_index.py  # and run parse.py with it set too
+```
+"""
+
+import os
+import sys
+import time
+from lexicon import INDEX_VERSION, build
+
+CCCANTO_FILE = 'cccanto-webdist.txt'
+READINGS_FILE = 'cccedict-canto-readings-150923.txt'
+INDEX_FILE = os.environ.get('CANTOPOLITAN_INDEX', 'cantopolitan.bin')  # where `parse.py` looks
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Compile the dictionaries into a prebuilt index")
+  parser.add_argument('--cccanto', default=CCCANTO_FILE, help=f"default: {CCCANTO_FILE}")
+  parser.add_argument('--readings', default=READINGS_FILE, help=f"default: {READINGS_FILE}")
+  parser.add_argument('--out', default=INDEX_FILE, help=f"default: {INDEX_FILE}")
+  args = parser.parse_args()
+
+  start = time.perf_counter()
+  keys = build(args.cccanto, args.readings, args.out)
+  print(
+      f"wrote {args.out} (version {INDEX_VERSION}, {keys} keys) in "
+      f"{time.perf_counter() - start:.2f} s",
+      file=sys.stderr)
@@ -1,70 +1,292 @@
 from contextlib import contextmanager
-from chinese import ChineseAnalyzer
-import os.path
+import hashlib
+import os
+import sqlite3
+import time
 import typing
 import pickle
 
+if typing.TYPE_CHECKING:
+  from chinese import ChineseAnalyzer
+
 ChineseAnalyzerResult = typing.Any
+SHARDS = 16  # SQLite files an `AnalysisCache` is split into
+BUSY_TIMEOUT = 60.0  # seconds to wait for another process to finish writing a shard
 
 
-def resultsDump(results: dict[str, ChineseAnalyzerResult], fid: typing.BinaryIO):
-  "Like JSON/pickle `dump`, serialize a dict of text->analyzer results to disk"
+def resultDumps(result: ChineseAnalyzerResult) -> bytes:
+  "Like pickle `dumps`, serialize one analyzer result, without its parent analyzer"
   # `ChineseAnalyzerResult`s include a pointer to the parent `ChineseAnalyzer`
   # object, which includes large dictionary objects, so pickle expands a small
   # result into 16 MB.  We overwrite this `__parent` slot so these results
-  # objects are lightweight, then add them back to the input objects.
+  # objects are lightweight, then add it back to the input object.
   # https://github.com/morinokami/chinese/blob/3f80ec36a4c4fa0b431626ae778d72ef28ebfa64/src/chinese/api.py#L44-L47
-  parents = []
-  for r in results.values():
-    parents.append(r._ChineseAnalyzerResult__parent)
-    r._ChineseAnalyzerResult__parent = None
-
-  pickle.dump(results, fid)
-
-  for result, parent in zip(results.values(), parents):
+  parent = result._ChineseAnalyzerResult__parent
+  result._ChineseAnalyzerResult__parent = None
+  try:
+    return pickle.dumps(result)
+  finally:
     result._ChineseAnalyzerResult__parent = parent
 
 
-def resultsLoad(fid: typing.BinaryIO, analyzer: ChineseAnalyzer):
-  "Like JSON/pickle `load`, deserialize a `dict` of analyzed results from disk"
+def resultLoads(data: bytes, analyzer: 'ChineseAnalyzer') -> ChineseAnalyzerResult:
+  "Like pickle `loads`, deserialize one analyzer result, making `analyzer` its parent"
   # As mentioned above, the pickled ChineseAnalyzerResult objects are missing
-  # their `__parent` members. As part of the hydration, set `analyzer` as each
+  # their `__parent` members. As part of the hydration, set `analyzer` as the
   # object's parent.
-  results: dict[str, ChineseAnalyzerResult] = pickle.load(fid)
-  for result in results.values():
-    result._ChineseAnalyzerResult__parent = analyzer
-  return results
+  result = pickle.loads(data)
+  result._ChineseAnalyzerResult__parent = analyzer
+  return result
+
+
+def textKey(text: str) -> bytes:
+  "Cache key for a text: a fixed-size content hash, however long the text is"
+  return hashlib.sha256(text.encode('utf8')).digest()
+
+
+class AnalysisCache:
+  """A long-lived, dict-like handle on an on-disk cache of Chinese analyzer results
+
+  The cache is a directory of `shards` SQLite files, each with one row per
+  analyzed text, keyed by a hash of the text (which also picks the shard), so
+  opening it and looking up or adding one result cost the same no matter how
+  much has been cached. Each row records when it was last used: once a shard
+  has more than its share of `maxEntries` rows, or its results take more than
+  its share of `maxBytes` bytes (either may be `None` for no limit), its
+  least-recently-used rows are evicted.
+
+  Many processes may use the same cache at once. Shards are in SQLite's WAL
+  mode, so lookups never wait for writers. New results and usage times are
+  kept in memory until `flush` (or `close`), or automatically after every
+  `flushEvery` new results, if given, which writes each shard's share in one
+  short transaction: writers only contend for a shard while flushing it, and
+  never lose each other's results.
+
+  `getData` and `setData` work with serialized results (see `resultDumps`), so
+  a process that only moves results around needn't build an `analyzer`.
+  """
+
+  def __init__(self,
+               cache_dir: str,
+               analyzer: typing.Optional['ChineseAnalyzer'],
+               flushEvery: typing.Optional[int] = None,
+               maxEntries: typing.Optional[int] = 10_000,
+               maxBytes: typing.Optional[int] = None,
+               shards: int = SHARDS):
+    self.cache_dir = cache_dir
+    self.analyzer = analyzer
+    self.flushEvery = flushEvery
+    # each shard's share of the limits
+    self.maxEntries = None if maxEntries is None else -(-maxEntries // shards)
+    self.maxBytes = None if maxBytes is None else -(-maxBytes // shards)
+    self.unsaved = 0
+
+    os.makedirs(cache_dir, exist_ok=True)
+    self.dbs = [self._open(os.path.join(cache_dir, f'{i:02x}.sqlite')) for i in range(shards)]
+    # per shard: results not yet written, with when they were set, and when rows were last used
+    self.pending: list[dict[bytes, tuple[bytes, int]]] = [dict() for _ in range(shards)]
+    self.used: list[dict[bytes, int]] = [dict() for _ in range(shards)]
+
+  @staticmethod
+  def _open(path: str) -> sqlite3.Connection:
+    # autocommit: `flush` delimits its own transactions, so none is left open between flushes
+    db = sqlite3.connect(path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    # switching to WAL fails at once, without waiting, while another process is creating the
+    # shard, so retry that and the schema (all idempotent) until `BUSY_TIMEOUT` runs out
+    deadline = time.monotonic() + BUSY_TIMEOUT
+    delay = 0.001
+    while True:
+      try:
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')  # a crash may lose the latest results, not corrupt
+        db.execute('''CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY,
+            result BLOB NOT NULL, size INTEGER NOT NULL, used INTEGER NOT NULL)''')
+        db.execute('CREATE INDEX IF NOT EXISTS resultsByUse ON results (used)')
+        return db
+      except sqlite3.OperationalError:
+        if time.monotonic() + delay > deadline:
+          db.close()
+          raise
+        time.sleep(delay)
+        delay = min(2 * delay, 0.1)
+
+  def _shard(self, key: bytes) -> int:
+    return key[0] % len(self.dbs)
+
+  def getData(self, text: str) -> typing.Optional[bytes]:
+    "The serialized result for `text`, if cached"
+    key = textKey(text)
+    shard = self._shard(key)
+    if key in self.pending[shard]:
+      data, _ = self.pending[shard][key]
+      self.pending[shard][key] = (data, time.time_ns())
+      return data
+    row = self.dbs[shard].execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+    if row is None:
+      return None
+    self.used[shard][key] = time.time_ns()
+    return row[0]
+
+  def __contains__(self, text: str) -> bool:
+    key = textKey(text)
+    shard = self._shard(key)
+    if key in self.pending[shard]:
+      return True
+    row = self.dbs[shard].execute('SELECT 1 FROM results WHERE key = ?', (key,)).fetchone()
+    return row is not None
+
+  def __getitem__(self, text: str) -> ChineseAnalyzerResult:
+    data = self.getData(text)
+    if data is None:
+      raise KeyError(text)
+    return resultLoads(data, self.analyzer)
+
+  def get(self, text: str) -> typing.Optional[ChineseAnalyzerResult]:
+    "Single-lookup alternative to `text in cache and cache[text]`"
+    data = self.getData(text)
+    return None if data is None else resultLoads(data, self.analyzer)
+
+  def __setitem__(self, text: str, result: ChineseAnalyzerResult):
+    self.setData(text, resultDumps(result))
+
+  def setData(self, text: str, data: bytes):
+    "Cache a serialized result for `text`"
+    key = textKey(text)
+    shard = self._shard(key)
+    self.pending[shard][key] = (data, time.time_ns())
+    self.used[shard].pop(key, None)
+    self.unsaved += 1
+    if self.flushEvery and self.unsaved >= self.flushEvery:
+      self.flush()
+
+  def __len__(self) -> int:
+    "How many results are cached, by all processes, counting this one's unflushed ones"
+    count = 0
+    for db, pending in zip(self.dbs, self.pending):
+      count += db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+      for key in pending:
+        count += db.execute('SELECT 1 FROM results WHERE key = ?', (key,)).fetchone() is None
+    return count
+
+  def _overLimit(self, count: int, size: int) -> bool:
+    return bool((self.maxEntries is not None and count > self.maxEntries) or
+                (self.maxBytes is not None and size > self.maxBytes))
+
+  def _evict(self, db: sqlite3.Connection):
+    count, size = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+    while self._overLimit(count, size):
+      row = db.execute('SELECT key, size FROM results ORDER BY used LIMIT 1').fetchone()
+      if row is None:
+        break
+      db.execute('DELETE FROM results WHERE key = ?', (row[0],))
+      count -= 1
+      size -= row[1]
+
+  def evict(self):
+    "Drop least-recently-used results until every shard is within its limits"
+    for db in self.dbs:
+      with self._transaction(db):
+        self._evict(db)
+
+  @staticmethod
+  @contextmanager
+  def _transaction(db: sqlite3.Connection):
+    # IMMEDIATE takes the shard's write lock up front, waiting up to `BUSY_TIMEOUT` for it
+    db.execute('BEGIN IMMEDIATE')
+    try:
+      yield
+    except BaseException:
+      db.execute('ROLLBACK')
+      raise
+    db.execute('COMMIT')
+
+  def flush(self):
+    "Write new results and usage times to disk, one transaction per shard"
+    for db, pending, used in zip(self.dbs, self.pending, self.used):
+      if not pending and not used:
+        continue
+      with self._transaction(db):
+        db.executemany('UPDATE results SET used = MAX(used, ?) WHERE key = ?',
+                       [(when, key) for key, when in used.items()])
+        db.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                       [(key, data, len(data), when) for key, (data, when) in pending.items()])
+        self._evict(db)
+      pending.clear()
+      used.clear()
+    self.unsaved = 0
+
+  def close(self):
+    self.flush()
+    for db in self.dbs:
+      db.close()
 
 
 @contextmanager
-def cache_analysis(cache_filename: str, analyzer: ChineseAnalyzer):
+def cache_analysis(cache_dir: str, analyzer: 'ChineseAnalyzer'):
   """Automatically cache Chinese analyzer results
 
   Usage:
 
   >>> from chinese import ChineseAnalyzer
   >>> analyzer = ChineseAnalyzer()
-  >>> with cache_analysis("cache.pickle", analyzer) as cache:
+  >>> with cache_analysis("analysis_cache", analyzer) as cache:
   >>>   for line in sys.stdin.readlines():
   >>>     result = cache[line] if line in cache else analyzer.parse(line)
   >>>     cache[line] = result
   >>>     result.pprint()
-  This manages the cache (a dict mapping text to Chinese analyzer results)
-  inside the body. Even if an exception is raised in the body, or the program
-  exits, the cache will be saved to disk.
-  """
-  cache: dict[str, ChineseAnalyzerResult] = dict()
+  This manages the cache (a dict-like `AnalysisCache` mapping text to Chinese
+  analyzer results) inside the body. Even if an exception is raised in the
+  body, or the program exits, the cache will be saved to disk.
 
-  # load the cache
-  if os.path.isfile(cache_filename):
-    with open(cache_filename, 'rb') as fid:
-      cache = resultsLoad(fid, analyzer)
+  To keep a cache open across many calls, use `AnalysisCache` directly.
+  """
+  # open the cache
+  cache = AnalysisCache(cache_dir, analyzer)
 
   try:
     # yield the cache to the outer program
     yield cache
 
   finally:
-    # dump the cache back to disk
-    with open(cache_filename, 'wb') as fid:
-      resultsDump(cache, fid)
+    # commit the cache to disk
+    cache.close()
+
+
+if __name__ == '__main__':
+  import tempfile
+  import types
+
+  with tempfile.TemporaryDirectory() as tmp:
+    # results round-trip through disk without their parent analyzer, and get the new one
+    parent, newParent = object(), object()
+    result = types.SimpleNamespace(words=['廣東話'], _ChineseAnalyzerResult__parent=parent)
+    with cache_analysis(os.path.join(tmp, 'roundtrip'), parent) as cache:  # type: ignore
+      cache['text'] = result
+      assert 'text' in cache and len(cache) == 1
+    assert result._ChineseAnalyzerResult__parent is parent
+    with cache_analysis(os.path.join(tmp, 'roundtrip'), newParent) as cache:  # type: ignore
+      loaded = cache['text']
+      assert loaded.words == ['廣東話'] and loaded._ChineseAnalyzerResult__parent is newParent
+      assert cache.get('other') is None and 'other' not in cache
+
+    # the least recently used results are evicted first, counting lookups as uses
+    cache = AnalysisCache(os.path.join(tmp, 'lru'), None, maxEntries=2, shards=1)
+    cache.setData('a', b'1')
+    cache.setData('b', b'2')
+    cache.flush()
+    assert cache.getData('a') == b'1'
+    cache.setData('c', b'3')
+    cache.flush()
+    assert len(cache) == 2 and cache.getData('b') is None and cache.getData('a') == b'1'
+    cache.close()
+
+    # and so are results past the size limit
+    cache = AnalysisCache(os.path.join(tmp, 'bytes'), None, maxBytes=10, shards=1)
+    cache.setData('x', b'123456')
+    cache.setData('y', b'abcdef')
+    assert len(cache) == 2  # unflushed results count too
+    cache.close()
+    cache = AnalysisCache(os.path.join(tmp, 'bytes'), None, maxBytes=10, shards=1)
+    assert len(cache) == 1 and cache.getData('y') == b'abcdef'
+    cache.close()
+  print("Success!")
@@ -8,19 +8,22 @@ following format:
 [traditional hanzi] [simplified hanzi] [Mandarin pinyin] {Cantonese pinyin} /English glosses/
 ```
 
-The dictionary is returned in a dict whose type is given by `CantoDict` below.
-The keys are hanzi, and values are a list of entries where each entry has
+`parseFile` returns the dictionary in a dict whose type is given by
+`CantoDict` below. The keys are hanzi, and values are a list of entries where
+each entry has
 - Mandarin pinyin,
 - Cantonese pinyin,
 - English gloss, and
 - the hanzi again.
 
-A JSON copy of the returned dict will be saved for faster loading.
+Entries are also indexed by simplified hanzi, where those differ, in a
+second dict, so text in either script can be looked up.
+
+Nothing reads these dicts at parse time: `lexicon.build` compiles them, with
+the readings (see `readings`), into the prebuilt index that `parse.py` loads.
 """
 
 import typing
-import json
-import os.path
 
 
 class CantoEntry(typing.TypedDict):
@@ -31,29 +34,24 @@ class CantoEntry(typing.TypedDict):
 
 
 Hanzi = str
-CantoDict = dict[Hanzi, list[CantoEntry]]
+CantoDict = typing.Mapping[Hanzi, list[CantoEntry]]
 
 
-def init(file: str, jsonfile: typing.Optional[str] = None) -> CantoDict:
-  """Loads the CC-Canto dictionary
+def parseFile(file: str) -> tuple[dict[Hanzi, list[CantoEntry]], dict[Hanzi, list[CantoEntry]]]:
+  """Parse the CC-Canto dictionary text file into plain dicts
 
   `file` is assumed to point to a CC-Canto dictionary file (currently called
-  "cccanto-webdist.txt").
-
-  A JSON file of the returned dict will be saved in `jsonfile` (by default,
-  `file + '.json'`).
+  "cccanto-webdist.txt"). Returns a dict keyed by traditional hanzi, and one
+  mapping simplified hanzi to the entries whose simplified form differs from
+  their traditional one (`hanzi`), sharing the same entry objects.
   """
-  jsonfile = jsonfile or (file + '.json')
-
-  if os.path.exists(jsonfile):
-    return json.load(open(jsonfile, 'r'))
-
-  d: CantoDict = dict()
+  d: dict[Hanzi, list[CantoEntry]] = dict()
+  simplified: dict[Hanzi, list[CantoEntry]] = dict()
   with open(file, 'r') as fid:
     for line in fid.readlines():
       if line.startswith('#'):
         continue
-      trad, _, rest = line.strip().split(" ", 2)
+      trad, simp, rest = line.strip().split(" ", 2)
       readings, glosses = rest.split('/', 1)
 
       mandarin, cantonese = readings.strip().split('] {')
@@ -68,13 +66,13 @@ def init(file: str, jsonfile: typing.Optional[str] = None) -> CantoDict:
         d[trad].append(result)
       else:
         d[trad] = [result]
+      if simp != trad:
+        simplified.setdefault(simp, []).append(result)
 
-  with open(jsonfile, 'w') as fid:
-    json.dump(d, fid)
-
-  return d
+  return d, simplified
 
 
 if __name__ == '__main__':
-  d = init('cccanto-webdist.txt')
+  d, simplified = parseFile('cccanto-webdist.txt')
   print(d['一個二個'])
+  assert simplified['一个二个'] == d['一個二個']
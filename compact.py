@@ -0,0 +1,87 @@
+"""
+Compact morpheme documents
+
+Every morpheme output by `parse.py` inlines its `cantoDefinitions` and
+`cantoPinyins` entries, and merged morphemes repeat the entries of the hidden
+morphemes under them, so the JSON is many times bigger than the text. A compact
+document instead stores each distinct entry once, in a table, and morphemes
+refer to entries by their index in that table:
+```
+{"entries": [{"hanzi": ..., "mandarin": ..., ...}, ...],
+ "morphemes": [{"hanzi": ..., "cantoDefinitions": [0, 3], "cantoPinyins": [1], ...}, ...]}
+```
+Everything else about the morphemes is unchanged.
+"""
+
+import typing
+from cccanto import CantoEntry
+from readings import ReadingEntry
+
+Entry = typing.Union[CantoEntry, ReadingEntry]
+MorphemeDict = dict[str, typing.Any]  # a `parse.Morpheme`, full or compact
+ENTRY_FIELDS = ('cantoDefinitions', 'cantoPinyins')
+
+
+class CompactDocument(typing.TypedDict):
+  entries: list[Entry]
+  morphemes: list[MorphemeDict]
+
+
+def isCompact(doc: typing.Any) -> bool:
+  "Whether parsed JSON is a `CompactDocument` rather than a list of morphemes"
+  return isinstance(doc, dict) and 'entries' in doc and 'morphemes' in doc
+
+
+def compactMorphemes(morphemes: typing.Iterable[MorphemeDict]) -> CompactDocument:
+  "Convert full morphemes into a `CompactDocument`, storing each distinct entry once"
+  entries: list[Entry] = []
+  ids: dict[tuple, int] = dict()
+
+  def entryId(entry: Entry) -> int:
+    key = tuple(sorted(entry.items()))
+    if key not in ids:
+      ids[key] = len(entries)
+      entries.append(entry)
+    return ids[key]
+
+  compacted: list[MorphemeDict] = []
+  for m in morphemes:
+    c = dict(m)
+    for field in ENTRY_FIELDS:
+      c[field] = [entryId(e) for e in m[field]]
+    compacted.append(c)
+  return CompactDocument(entries=entries, morphemes=compacted)
+
+
+def resolveEntries(refs: list, entries: typing.Optional[list[Entry]]) -> list[Entry]:
+  """A morpheme's `cantoDefinitions` or `cantoPinyins` as entries
+
+  `refs` may already be entries (from a full morpheme), or indexes into
+  `entries` (from a compact morpheme).
+  """
+  if entries is None or len(refs) == 0 or not isinstance(refs[0], int):
+    return refs
+  return [entries[i] for i in refs]
+
+
+def expandMorpheme(c: MorphemeDict, entries: list[Entry]) -> MorphemeDict:
+  "Convert one compact morpheme back into a full one, given its document's `entries`"
+  m = dict(c)
+  for field in ENTRY_FIELDS:
+    m[field] = resolveEntries(c[field], entries)
+  return m
+
+
+def expandDocument(doc: CompactDocument) -> list[MorphemeDict]:
+  """Convert a `CompactDocument` back into full morphemes
+
+  Morphemes that refer to the same entry share the same entry object, so this
+  takes little more memory than the compact document.
+  """
+  entries = doc['entries']
+  return [expandMorpheme(c, entries) for c in doc['morphemes']]
+
+
+def loadMorphemes(doc: typing.Any) -> list[MorphemeDict]:
+  "Full morphemes from parsed JSON that's either a list of morphemes or a `CompactDocument`"
+  return expandDocument(doc) if isCompact(doc) else doc
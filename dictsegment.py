@@ -0,0 +1,78 @@
+"""
+Dictionary-only segmentation, without the Chinese analyzer
+
+`chinese.ChineseAnalyzer` (Jieba plus its own copy of CC-CEDICT) is the
+slowest, biggest part of parsing, and the pipeline then rewrites much of its
+segmentation anyway: runs of its tokens found in CC-Canto get merged, and
+tokens without readings get split again. A `DictionaryAnalyzer` instead
+segments text directly over the lexicon (CC-Canto and CC-CEDICT readings
+headwords, see `lexicon`), with the same biggest-pieces scoring as
+`wordfill.Segmenter`, and never imports `chinese`.
+
+Its results quack like `chinese.ChineseAnalyzerResult` (`tokens()`, and a list
+of hits with `pinyin` and `definitions` per token), so `parse.Pipeline` turns
+them into the same `Morpheme` records. Each token's hits are its distinct
+Mandarin readings from the CC-CEDICT readings, without English definitions
+(those come from CC-Canto, as always); tokens without readings get one empty
+hit, like the analyzer gives unknown words.
+
+Runs of ASCII letters and digits are kept together as one token, and each
+whitespace character is its own token, as with Jieba.
+"""
+
+import re
+import typing
+from lexicon import Lexicon
+from wordfill import Segmenter
+
+# runs of ASCII letters/digits, single whitespace characters, and runs of everything else
+TOKEN_RUN = re.compile(r'[A-Za-z0-9]+|\s|[^\sA-Za-z0-9]+')
+
+
+class Hit(typing.NamedTuple):
+  "Like the analyzer's dictionary hits: `pinyin` is a list of syllables"
+  pinyin: typing.Optional[list[str]]
+  definitions: typing.Optional[list[str]]
+
+
+NO_HITS = [Hit(None, None)]
+
+
+class DictionaryAnalysis:
+  "A segmented text, like a `chinese.ChineseAnalyzerResult`"
+
+  def __init__(self, tokens: list[str], lexicon: Lexicon):
+    self._tokens = tokens
+    self.lexicon = lexicon
+
+  def tokens(self) -> list[str]:
+    return self._tokens
+
+  def __getitem__(self, token: str) -> list[Hit]:
+    mandarins = dict.fromkeys(e['mandarin'] for e in self.lexicon.lookup(token).cantoPinyins)
+    if not mandarins:
+      return NO_HITS
+    return [Hit(mandarin.split(' '), None) for mandarin in mandarins]
+
+
+class DictionaryAnalyzer:
+  "Drop-in for `chinese.ChineseAnalyzer` that segments with the lexicon alone"
+
+  def __init__(self, lexicon: Lexicon):
+    self.lexicon = lexicon
+    self.segmenter = Segmenter(lexicon)
+
+  def segment(self, text: str) -> list[str]:
+    "Split `text` into tokens: lexicon headwords where possible, else single characters"
+    tokens: list[str] = []
+    for match in TOKEN_RUN.finditer(text):
+      run = match.group()
+      if run[0].isascii() and run[0].isalnum() or run.isspace():
+        tokens.append(run)
+      else:
+        tokens.extend(self.segmenter.segment(run, unknown=True))
+    return tokens
+
+  def parse(self, text: str, traditional: bool = True) -> DictionaryAnalysis:
+    "Segment `text` (in either script: `traditional` is ignored)"
+    return DictionaryAnalysis(self.segment(text), self.lexicon)
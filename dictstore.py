@@ -0,0 +1,189 @@
+"""
+Compiled, memory-mapped dictionary store
+
+The dictionaries are text files that parse into dicts mapping hanzi to a list
+of entries. Rather than re-parsing the text (or `json.load`ing a
+multi-megabyte cache) every time, we compile such a dict once into a
+read-only binary file and open it with `mmap`, so loading is nearly free and
+entries are only decoded when they're looked up. The prebuilt index (see
+`lexicon.build`) is such a store.
+
+The file layout is:
+1. a fixed header: magic bytes, a stamp of the sources the store was built
+   from (two integers, used to detect stale stores: see `openIfFresh`), and
+   the number of keys `N`,
+2. `N` index records, sorted by the UTF-8 bytes of the key, each giving the
+   offset and length of the key and of its value in the blob area, and an
+   integer tag the builder may attach to the key (see `build`),
+3. the blob area: UTF-8 keys and JSON-encoded lists of entries. Identical
+   values are stored once, and records share them.
+
+Since UTF-8 byte order matches code point order, lookup is a binary search over
+the index records.
+"""
+
+import json
+import mmap
+import os
+import os.path
+import struct
+import typing
+from collections.abc import Mapping
+
+MAGIC = b'CANTODB4'
+HEADER = struct.Struct('<8sQqQ')  # magic, source stamp (two integers), number of keys
+RECORD = struct.Struct('<IIIII')  # key offset, key length, value offset, value length, tag
+
+SourceStamp = tuple[int, int]  # identifies the sources a store was built from, e.g., a checksum
+
+
+def build(path: str,
+          d: Mapping[str, list],
+          stamp: SourceStamp = (0, 0),
+          tags: typing.Optional[Mapping[str, int]] = None) -> None:
+  """Compile a dict of string -> list of JSON-able entries into a store at `path`
+
+  `tags` optionally gives some keys a 32-bit unsigned tag (default 0), which
+  `MappedDict.tagAt` reads without decoding the value.
+
+  The file is written to a temporary path first and renamed into place so a
+  reader never sees a half-written store.
+  """
+  blob = bytearray()
+  index = bytearray()
+  valueSpans: dict[bytes, tuple[int, int]] = dict()
+  for key in sorted(d, key=lambda k: k.encode('utf8')):
+    keyBytes = key.encode('utf8')
+    valueBytes = json.dumps(d[key], ensure_ascii=False, separators=(',', ':')).encode('utf8')
+    keyOffset = len(blob)
+    blob.extend(keyBytes)
+    if valueBytes not in valueSpans:
+      valueSpans[valueBytes] = (len(blob), len(valueBytes))
+      blob.extend(valueBytes)
+    valueOffset, valueLength = valueSpans[valueBytes]
+    tag = tags.get(key, 0) if tags else 0
+    index += RECORD.pack(keyOffset, len(keyBytes), valueOffset, valueLength, tag)
+
+  tmp = f'{path}.{os.getpid()}.tmp'
+  with open(tmp, 'wb') as fid:
+    fid.write(HEADER.pack(MAGIC, stamp[0], stamp[1], len(d)))
+    fid.write(index)
+    fid.write(blob)
+  os.replace(tmp, path)
+
+
+class MappedDict(Mapping[str, list]):
+  """A compiled store, opened: a read-only, `Mapping`-compatible view of it
+
+  Supports `key in d`, `d[key]`, `d.get(key)`, `len(d)` and iteration (in
+  sorted order), like the dict it was compiled from. Values are decoded from
+  JSON on each lookup. `close` unmaps the file.
+  """
+
+  def __init__(self, path: str):
+    self.path = path
+    with open(path, 'rb') as fid:
+      mm = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      magic, size, mtime, count = HEADER.unpack_from(mm, 0)
+    except struct.error:
+      magic = None
+    if magic != MAGIC:
+      mm.close()
+      raise ValueError(f'{path} is not a compiled dictionary store')
+    self.stamp: SourceStamp = (size, mtime)
+    self._mm = mm
+    self._recordsStart = HEADER.size
+    self._count = count
+    self._blobStart = HEADER.size + count * RECORD.size
+
+  def _record(self, i: int) -> tuple[int, int, int, int, int]:
+    return RECORD.unpack_from(self._mm, self._recordsStart + i * RECORD.size)
+
+  def _keyBytes(self, i: int) -> bytes:
+    keyOffset, keyLength, _, _, _ = self._record(i)
+    start = self._blobStart + keyOffset
+    return self._mm[start:start + keyLength]
+
+  def _bisect(self, key: bytes) -> int:
+    "Index of the first key >= `key`"
+    lo, hi = 0, self._count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      if self._keyBytes(mid) < key:
+        lo = mid + 1
+      else:
+        hi = mid
+    return lo
+
+  def find(self, key: str) -> typing.Optional[int]:
+    "Index of `key`'s record (for `tagAt` and `valueAt`), or None if it's not a key"
+    if not isinstance(key, str):
+      return None
+    keyBytes = key.encode('utf8')
+    i = self._bisect(keyBytes)
+    if i < self._count and self._keyBytes(i) == keyBytes:
+      return i
+    return None
+
+  def probe(self, prefix: str) -> tuple[bool, bool]:
+    """Whether `prefix` is a key, and whether it's a prefix of any key
+
+    The second flag includes `prefix` itself, so if the first flag is true the
+    second one is too. Both take a single binary search, so walking a string
+    forward while the second flag holds finds all keys starting at its head
+    without probing hopeless extensions.
+    """
+    prefixBytes = prefix.encode('utf8')
+    i = self._bisect(prefixBytes)
+    if i >= self._count:
+      return (False, False)
+    keyBytes = self._keyBytes(i)
+    return (keyBytes == prefixBytes, keyBytes.startswith(prefixBytes))
+
+  def tagAt(self, i: int) -> int:
+    return self._record(i)[4]
+
+  def valueAt(self,
+              i: int,
+              objectHook: typing.Optional[typing.Callable[[dict], typing.Any]] = None) -> list:
+    "Decode record `i`'s value, passing each JSON object through `objectHook` if given"
+    _, _, valueOffset, valueLength, _ = self._record(i)
+    start = self._blobStart + valueOffset
+    return json.loads(self._mm[start:start + valueLength], object_hook=objectHook)
+
+  def __getitem__(self, key: str) -> list:
+    i = self.find(key)
+    if i is None:
+      raise KeyError(key)
+    return self.valueAt(i)
+
+  def __contains__(self, key: object) -> bool:
+    return self.find(key) is not None  # type: ignore
+
+  def __len__(self) -> int:
+    return self._count
+
+  def __iter__(self) -> typing.Iterator[str]:
+    for i in range(self._count):
+      yield self._keyBytes(i).decode('utf8')
+
+  def close(self) -> None:
+    self._mm.close()
+
+
+def openIfFresh(path: str, stamp: typing.Optional[SourceStamp]) -> typing.Optional[MappedDict]:
+  """Open the compiled store at `path` if it exists and was built from `stamp`
+
+  With a `stamp` of None (the sources are missing), any valid store will do.
+  """
+  if not os.path.exists(path):
+    return None
+  try:
+    store = MappedDict(path)
+  except ValueError:
+    return None
+  if stamp is None or store.stamp == stamp:
+    return store
+  store.close()
+  return None
@@ -1,32 +1,181 @@
+import atexit
 import json
+import os
+import os.path
+import tempfile
+import threading
+import typing
 from contextlib import contextmanager
-from pypandoc import convert_text
-from flask import Flask, send_from_directory
-from parse import morphemeToBulletedDefs, morphemeToRuby, Morpheme
+from flask import Flask, abort, jsonify, request, send_from_directory
+from compact import compactMorphemes
+from jsonstream import MorphemeReader
+from markdown_html import htmlPage, markdownToHtml, markdownToHtmlBody, pandoc
 from partition_by import partitionBy
+from render import Morpheme, lineToMarkdown, pageMarkdown
 
 JSON_PATH = 'out.json'
-PANDOC_FROM = 'markdown_github+hard_line_breaks+yaml_metadata_block+markdown_in_html_blocks+auto_identifiers'
-PANDOC_EXTRA_ARGS = ['-s', '--metadata', 'pagetitle=Cantonese']
+# "python" renders HTML in-process (see `markdown_html`); "pandoc" shells out to pandoc
+RENDERER = os.environ.get('CANTOPOLITAN_RENDERER', 'python')
+SAVE_DELAY = 2.0  # seconds to collect edits before writing them to disk together
+EDITABLE = {'hidden': bool, 'reading': str}  # morpheme fields the API may patch
 
 
-def pandoc(markdown: str) -> str:
-  return convert_text(markdown, to='html5', format=PANDOC_FROM, extra_args=PANDOC_EXTRA_ARGS)
+def markdownToPage(markdown: str) -> str:
+  "Render Markdown to a standalone HTML page with the configured `RENDERER`"
+  if RENDERER == 'pandoc':
+    return pandoc(markdown)
+  return markdownToHtml(markdown)
+
+
+def fileStamp(path: str) -> tuple[int, int]:
+  "Size and modification time of the file at `path`, to tell when it changes"
+  stat = os.stat(path)
+  return (stat.st_size, stat.st_mtime_ns)
+
+
+def dumpAtomically(doc: typing.Any, jsonpath: str):
+  "Write JSON to a temporary file beside `jsonpath`, then rename it over `jsonpath`"
+  fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(jsonpath)), suffix='.tmp')
+  try:
+    with os.fdopen(fd, 'w') as fid:
+      json.dump(doc, fid)
+    os.replace(tmp, jsonpath)
+  except BaseException:
+    os.remove(tmp)
+    raise
 
 
 @contextmanager
 def saved_morphemes(jsonpath: str):
   morphemes: list[Morpheme] = []
-  # load morphemes
+  # load morphemes, remembering if the file was compact
   with open(jsonpath, 'r') as fid:
-    morphemes = json.load(fid)
+    reader = MorphemeReader(fid)
+    morphemes = list(reader)  # type: ignore
+  compact = reader.compact
   try:
     # yield morphemes to the outer program
     yield morphemes
   finally:
-    # dump morphemes to disk
-    with open(jsonpath, 'w') as fid:
-      json.dump(morphemes, fid)
+    # dump morphemes to disk, in the same format
+    dumpAtomically(compactMorphemes(morphemes) if compact else morphemes, jsonpath)
+
+
+class Document:
+  """An editable morpheme document, held in memory and split into lines
+
+  The morphemes are partitioned into lines with `partitionBy` (runs of newline
+  morphemes are their own lines), and each line's rendered HTML is cached, so
+  patching a morpheme only re-renders its line.
+
+  Edits are written back behind the scenes: the first edit after a save
+  starts a `SAVE_DELAY` timer, and when it fires, every edit made meanwhile is
+  written at once, atomically, in the format (full or compact) the file was
+  read in. If the file changes on disk while there are no unsaved edits, it's
+  reloaded.
+  """
+
+  def __init__(self, jsonpath: str):
+    self.jsonpath = jsonpath
+    self.lock = threading.RLock()
+    self.timer: typing.Optional[threading.Timer] = None
+    self.load()
+
+  def load(self):
+    with self.lock:
+      self.stamp = fileStamp(self.jsonpath)
+      with open(self.jsonpath, 'r') as fid:
+        reader = MorphemeReader(fid)
+        self.lines: list[list[Morpheme]] = list(
+            partitionBy(lambda m: m['hanzi'] == '\n', iter(reader)))  # type: ignore
+      self.compact = reader.compact
+      self.lineHtml: dict[int, str] = dict()
+      self.dirty = False
+      self.version = 0
+      self.pandocPage: typing.Optional[tuple[int, str]] = None
+
+  def reloadIfChanged(self):
+    with self.lock:
+      if not self.dirty and fileStamp(self.jsonpath) != self.stamp:
+        self.load()
+
+  def line(self, n: int) -> list[Morpheme]:
+    if not 0 <= n < len(self.lines):
+      raise IndexError(n)
+    return self.lines[n]
+
+  def renderLine(self, n: int) -> str:
+    "HTML fragment for line `n`, cached until the line is patched"
+    with self.lock:
+      html = self.lineHtml.get(n)
+      if html is None:
+        html = markdownToHtmlBody(lineToMarkdown(self.line(n)))
+        self.lineHtml[n] = html
+      return html
+
+  def page(self) -> str:
+    "The whole document as a standalone HTML page"
+    with self.lock:
+      if RENDERER == 'pandoc':
+        if self.pandocPage is None or self.pandocPage[0] != self.version:
+          markdown = pageMarkdown(m for line in self.lines for m in line)
+          self.pandocPage = (self.version, pandoc(markdown))
+        return self.pandocPage[1]
+      return htmlPage("\n".join(filter(None, map(self.renderLine, range(len(self.lines))))))
+
+  def patch(self, n: int, i: int, changes: dict[str, typing.Any]) -> Morpheme:
+    """Apply `changes` (see `EDITABLE`) to morpheme `i` of line `n`
+
+    A `reading` of `None` removes the user's chosen reading.
+    """
+    with self.lock:
+      line = self.line(n)
+      if not 0 <= i < len(line):
+        raise IndexError(i)
+      morpheme = line[i]
+      for key, value in changes.items():
+        if key not in EDITABLE or not (isinstance(value, EDITABLE[key]) or
+                                       (key == 'reading' and value is None)):
+          raise ValueError(f'cannot set {key} to {value!r}')
+      for key, value in changes.items():
+        if value is None:
+          morpheme.pop(key, None)  # type: ignore
+        else:
+          morpheme[key] = value  # type: ignore
+      self.lineHtml.pop(n, None)
+      self.version += 1
+      self.dirty = True
+      if self.timer is None:
+        self.timer = threading.Timer(SAVE_DELAY, self.save)
+        self.timer.daemon = True
+        self.timer.start()
+      return morpheme
+
+  def save(self):
+    "Write unsaved edits to disk now"
+    with self.lock:
+      if self.timer is not None:
+        self.timer.cancel()
+        self.timer = None
+      if not self.dirty:
+        return
+      morphemes = [m for line in self.lines for m in line]
+      dumpAtomically(compactMorphemes(morphemes) if self.compact else morphemes, self.jsonpath)
+      self.stamp = fileStamp(self.jsonpath)
+      self.dirty = False
+
+
+_document: typing.Optional[Document] = None
+
+
+def document() -> Document:
+  "The document at `JSON_PATH`, loaded on first use and saved when the server exits"
+  global _document
+  if _document is None:
+    _document = Document(JSON_PATH)
+    atexit.register(_document.save)
+  _document.reloadIfChanged()
+  return _document
 
 
 app = Flask(__name__)
@@ -39,19 +188,33 @@ def css():
 
 @app.route("/")
 def hello_world():
-  with open(JSON_PATH, 'r') as fid:
-    morphemes: list[Morpheme] = json.load(fid)
-  # markdown = "".join(map(morphemeToRuby, morphemes))
-
-  markdownLines: list[str] = []
-  morphemesIter = iter(morphemes)
-  for line in partitionBy(lambda m: m['hanzi'] == '\n', morphemesIter):
-    text = "".join(map(morphemeToRuby, line))
-    if len(text.strip()) == 0:
-      continue
-    markdownLines.append(f'\n## {text}')
-    defs = "\n".join(morphemeToBulletedDefs(m) for m in line)
-    markdownLines.append(defs)
-  markdown = "\n".join(markdownLines)
-
-  return pandoc(markdown)
+  return document().page()
+
+
+@app.route('/api/lines')
+def line_count():
+  return jsonify(count=len(document().lines))
+
+
+@app.route('/api/lines/<int:n>')
+def get_line(n: int):
+  doc = document()
+  try:
+    return jsonify(index=n, morphemes=doc.line(n), html=doc.renderLine(n))
+  except IndexError:
+    abort(404)
+
+
+@app.route('/api/lines/<int:n>/morphemes/<int:i>', methods=['PATCH'])
+def patch_morpheme(n: int, i: int):
+  doc = document()
+  changes = request.get_json(force=True)
+  if not isinstance(changes, dict):
+    abort(400)
+  try:
+    morpheme = doc.patch(n, i, changes)
+  except IndexError:
+    abort(404)
+  except ValueError:
+    abort(400)
+  return jsonify(morpheme=morpheme, html=doc.renderLine(n))
@@ -0,0 +1,111 @@
+"""
+Render many parsed documents to HTML pages at once
+
+Each `.json` file of morphemes (full or compact, as written by `parse.py`)
+becomes a standalone `.html` page with the editor server's Markdown (see
+`render.pageMarkdown`), beside it or in `--out-dir`. Documents are rendered
+in batches of up to `BATCH_SIZE` across a pool of `--jobs` processes.
+
+The default renderer converts the Markdown in-process (see `markdown_html`),
+so needs no pandoc at all. With `--renderer pandoc`, each batch is converted
+by a single pandoc run (see `markdown_html.pandocPages`) instead of one run per
+document.
+
+Usage:
+```
+python export_html.py --jobs 8 parsed/ --out-dir site/
+```
+Prints how many documents were rendered, and how many per second, to stderr.
+"""
+
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+import typing
+from jsonstream import iterMorphemes
+from markdown_html import markdownToHtml, pandocPages
+from input_files import outputFiles
+from render import pageMarkdown
+
+RENDERERS = ('python', 'pandoc')
+BATCH_SIZE = 16  # most documents per task, and per pandoc run
+
+Batch = list[tuple[str, str]]  # JSON and HTML paths
+
+
+def readMarkdown(path: str) -> str:
+  "The page Markdown for the morphemes in the JSON file at `path`"
+  with open(path, 'r') as fid:
+    return pageMarkdown(iterMorphemes(fid))  # type: ignore
+
+
+def renderBatch(job: tuple[Batch, str]) -> int:
+  "Render each JSON file in the batch to its HTML file with the renderer, returning how many"
+  batch, renderer = job
+  markdowns = [readMarkdown(jsonPath) for jsonPath, _ in batch]
+  if renderer == 'pandoc':
+    pages = pandocPages(markdowns)
+  else:
+    pages = [markdownToHtml(markdown) for markdown in markdowns]
+  for (_, htmlPath), page in zip(batch, pages):
+    with open(htmlPath, 'w') as fid:
+      fid.write(page)
+  return len(batch)
+
+
+def batches(items: list, size: int) -> typing.Iterator[list]:
+  iterator = iter(items)
+  while batch := list(itertools.islice(iterator, size)):
+    yield batch
+
+
+def exportFiles(paths: typing.Iterable[str],
+                jobs: typing.Optional[int] = None,
+                outDir: typing.Optional[str] = None,
+                renderer: str = 'python',
+                batchSize: int = BATCH_SIZE) -> int:
+  """Render JSON files to HTML pages in parallel
+
+  `paths` may include directories, whose `.json` files are all rendered (see
+  `input_files.outputFiles`). Batches are sized to keep all `jobs` processes
+  (default: one per core) busy. Returns the number of documents rendered.
+  """
+  if renderer not in RENDERERS:
+    raise ValueError(f'renderer must be one of {RENDERERS}')
+  files = outputFiles(paths, outDir, '.json', '.html')
+  numJobs = jobs or os.cpu_count() or 1
+  size = max(1, min(batchSize, -(-len(files) // numJobs)))
+  tasks = [(batch, renderer) for batch in batches(files, size)]
+  if numJobs == 1:
+    return sum(map(renderBatch, tasks))
+  methods = multiprocessing.get_all_start_methods()
+  context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+  with context.Pool(numJobs) as pool:
+    return sum(pool.imap_unordered(renderBatch, tasks))
+
+
+if __name__ == '__main__':
+  import argparse
+
+  parser = argparse.ArgumentParser(description="Render parsed JSON documents to HTML pages")
+  parser.add_argument(
+      'inputs', nargs='+', help="JSON files, or directories of `.json` files, to render")
+  parser.add_argument(
+      '-j', '--jobs', type=int, help="number of worker processes (default: one per core)")
+  parser.add_argument('--out-dir', help="write the `.html` files here instead of beside the inputs")
+  parser.add_argument(
+      '--renderer',
+      choices=RENDERERS,
+      default=os.environ.get('CANTOPOLITAN_RENDERER', 'python'),
+      help="render in-process (default), or with pandoc, one run per batch")
+  parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+  args = parser.parse_args()
+
+  start = time.perf_counter()
+  done = exportFiles(args.inputs, args.jobs, args.out_dir, args.renderer, args.batch_size)
+  seconds = time.perf_counter() - start
+  print(
+      f"rendered {done} documents in {seconds:.2f} s ({done / seconds:.1f} documents/s)",
+      file=sys.stderr)
@@ -0,0 +1,75 @@
+"""
+Find input files, and where to write each one's output
+
+Shared by the batch entry points, `parse.py` (text to JSON) and
+`export_html.py` (JSON to HTML), so neither needs the other.
+"""
+
+import os
+import os.path
+import typing
+
+
+def inputFiles(paths: typing.Iterable[str],
+               extension: str = '.txt') -> typing.Iterator[tuple[str, str]]:
+  """Expand directories among `paths` into the files with `extension` inside them
+
+  Yields each file's path and its name: its path relative to the directory it
+  was found in, or, for a file given directly, its base name.
+  """
+  for path in paths:
+    if os.path.isdir(path):
+      for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for file in sorted(files):
+          if file.endswith(extension):
+            found = os.path.join(root, file)
+            yield found, os.path.relpath(found, path)
+    else:
+      yield path, os.path.basename(path)
+
+
+def outputFiles(paths: typing.Iterable[str],
+                outDir: typing.Optional[str] = None,
+                inputExtension: str = '.txt',
+                outputExtension: str = '.json') -> list[tuple[str, str]]:
+  """Each input file (see `inputFiles`), and where to write its output
+
+  The output has the input's name but `outputExtension`, and goes beside the
+  input or, with `outDir`, under `outDir` (keeping the name's subdirectories,
+  which are created). Raises `ValueError` if two inputs would get the same
+  output, before anything is written.
+  """
+  files: list[tuple[str, str]] = []
+  inputsByOutput: dict[str, str] = dict()
+  for path, name in inputFiles(paths, inputExtension):
+    out = os.path.splitext(os.path.join(outDir, name) if outDir else path)[0] + outputExtension
+    key = os.path.abspath(out)
+    if key in inputsByOutput:
+      raise ValueError(f'{inputsByOutput[key]} and {path} would both be written to {out}')
+    inputsByOutput[key] = path
+    files.append((path, out))
+  if outDir:
+    for directory in {os.path.dirname(out) for _, out in files}:
+      os.makedirs(directory, exist_ok=True)
+  return files
+
+
+if __name__ == '__main__':
+  import tempfile
+
+  with tempfile.TemporaryDirectory() as tmp:
+    # same-named files in different subdirectories keep their subdirectories under `outDir`
+    for name in ['x/a.txt', 'y/a.txt']:
+      os.makedirs(os.path.join(tmp, 'in', os.path.dirname(name)), exist_ok=True)
+      open(os.path.join(tmp, 'in', name), 'w').close()
+    outDir = os.path.join(tmp, 'out')
+    outs = [out for _, out in outputFiles([os.path.join(tmp, 'in')], outDir)]
+    assert outs == [os.path.join(outDir, 'x', 'a.json'), os.path.join(outDir, 'y', 'a.json')], outs
+    assert os.path.isdir(os.path.join(outDir, 'y'))
+    try:  # but two inputs that would share an output is an error
+      outputFiles([os.path.join(tmp, 'in', 'x'), os.path.join(tmp, 'in', 'y')], outDir)
+      assert False, 'duplicate outputs should raise'
+    except ValueError:
+      pass
+  print("Success!")
@@ -0,0 +1,162 @@
+"""
+Read morphemes from JSON incrementally
+
+`json.load`ing a parsed document holds the whole file's text and every
+morpheme in memory before the first one can be used. A `MorphemeReader`
+instead reads the file a chunk at a time and yields morphemes one by one, so
+consumers like `partitionBy` and the Markdown renderers can work on the start
+of a document before the end has been read.
+
+It reads any sequence of whitespace-separated JSON documents, each either an
+array of morphemes or a `compact.CompactDocument`: that covers `parse.py`'s
+output, with or without `--compact`, and its `--ndjson` output. A compact
+document's `entries` table is read whole (its morphemes refer to it), but if
+it comes before its `morphemes`, as `compact.compactMorphemes` writes it, the
+morphemes are still streamed.
+"""
+
+import json
+import typing
+from compact import MorphemeDict, expandDocument, expandMorpheme
+
+CHUNK_SIZE = 1 << 16  # characters to read at a time
+WHITESPACE = ' \t\n\r'
+
+
+class MorphemeReader:
+  """Iterate over the morphemes of JSON read from `fid`
+
+  After iteration starts, `compact` says whether any of the documents read so
+  far was a `compact.CompactDocument`.
+  """
+
+  def __init__(self, fid: typing.TextIO, chunkSize: int = CHUNK_SIZE):
+    self.fid = fid
+    self.chunkSize = chunkSize
+    self.decoder = json.JSONDecoder()
+    self.buffer = ''
+    self.pos = 0
+    self.eof = False
+    self.compact = False
+
+  def __iter__(self) -> typing.Iterator[MorphemeDict]:
+    while True:
+      c = self._peek()
+      if c == '':
+        return
+      elif c == '[':
+        yield from self._array()
+      elif c == '{':
+        self.compact = True
+        yield from self._compactDocument()
+      else:
+        raise ValueError(f'expected an array or object at {self._where()}, got {c!r}')
+
+  def _fill(self, size: int) -> bool:
+    "Read `size` more characters into the buffer, dropping what's been consumed"
+    if self.eof:
+      return False
+    chunk = self.fid.read(size)
+    self.buffer = self.buffer[self.pos:] + chunk
+    self.pos = 0
+    self.eof = len(chunk) == 0
+    return not self.eof
+
+  def _where(self) -> str:
+    return f'{self.buffer[self.pos:self.pos + 20]!r}'
+
+  def _peek(self) -> str:
+    "Skip whitespace and return the next character, or '' at the end of the input"
+    while True:
+      while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+        self.pos += 1
+      if self.pos < len(self.buffer):
+        return self.buffer[self.pos]
+      if not self._fill(self.chunkSize):
+        return ''
+
+  def _expect(self, chars: str) -> str:
+    c = self._peek()
+    if c == '' or c not in chars:
+      raise ValueError(f'expected one of {chars!r} at {self._where()}')
+    self.pos += 1
+    return c
+
+  def _value(self) -> typing.Any:
+    "Decode one whole JSON value, reading more (in ever bigger chunks) until it's complete"
+    self._peek()
+    size = self.chunkSize
+    while True:
+      try:
+        value, end = self.decoder.raw_decode(self.buffer, self.pos)
+      except json.JSONDecodeError:
+        if not self._fill(size):
+          raise
+      else:
+        # a number at the very end of the buffer might continue in the next chunk
+        if end < len(self.buffer) or not self._fill(size):
+          self.pos = end
+          return value
+      size *= 2
+
+  def _array(self) -> typing.Iterator[typing.Any]:
+    "Yield the elements of an array one at a time"
+    self._expect('[')
+    if self._peek() == ']':
+      self.pos += 1
+      return
+    while True:
+      yield self._value()
+      if self._expect(',]') == ']':
+        return
+
+  def _compactDocument(self) -> typing.Iterator[MorphemeDict]:
+    self._expect('{')
+    entries = None
+    unresolved: typing.Optional[list[MorphemeDict]] = None
+    if self._peek() != '}':
+      while True:
+        key = self._value()
+        self._expect(':')
+        if key == 'morphemes' and entries is not None:
+          for c in self._array():
+            yield expandMorpheme(c, entries)
+          unresolved = []
+        elif key == 'morphemes':
+          unresolved = list(self._array())
+        elif key == 'entries':
+          entries = self._value()
+        else:
+          self._value()
+        if self._expect(',}') == '}':
+          break
+    if entries is None or unresolved is None:
+      raise ValueError('expected a compact document with "entries" and "morphemes"')
+    yield from expandDocument(dict(entries=entries, morphemes=unresolved))  # type: ignore
+
+
+def iterMorphemes(fid: typing.TextIO) -> typing.Iterator[MorphemeDict]:
+  "Lazily read full morphemes from JSON (see `MorphemeReader`)"
+  return iter(MorphemeReader(fid))
+
+
+if __name__ == '__main__':
+  import io
+  from compact import compactMorphemes
+
+  entry = dict(hanzi='大', traditional='大', mandarin='da4', cantonese='daai6')
+  morphemes = [
+      dict(hanzi=str(i), cantoDefinitions=[entry] * (i % 2), cantoPinyins=[], n=10**i)
+      for i in range(40)
+  ]
+  text = json.dumps(morphemes)
+  compactText = json.dumps(compactMorphemes(morphemes))
+  ndjson = '\n'.join(json.dumps(morphemes[i:i + 7]) for i in range(0, 40, 7)) + '\n'
+  cases = [(text, morphemes, False), (compactText, morphemes, True), (ndjson, morphemes, False),
+           (compactText + '\n' + text, morphemes * 2, True), (' [ ] ', [], False)]
+  for doc, expected, compact in cases:
+    for chunkSize in [1, 3, 1000]:
+      reader = MorphemeReader(io.StringIO(doc), chunkSize)
+      assert list(reader) == expected, (doc[:50], chunkSize)
+      assert reader.compact == compact
+  print("Success!")
@@ -0,0 +1,240 @@
+"""
+One index over both dictionaries
+
+Every token used to be looked up in CC-Canto (`cccanto`) and in the CC-Canto
+readings (`readings`) separately, each with an `in` and then a `[]`, and
+splitting words needed the union of both dictionaries' headwords. A `Lexicon`
+is compiled once from both into a single `dictstore` store whose keys are
+every headword of either dictionary *and every prefix of one*, so a single
+binary search answers everything in a `Hit`: both lists of entries, whether
+the string is a headword, whether it starts any headword, and how long the
+longest headword starting with it is.
+
+Headwords are indexed in both scripts: a string that's a dictionary's
+simplified headword (in the second dict its `parseFile` returns), but not one
+of its traditional headwords, gets that dictionary's entries for the
+simplified form. Traditional headwords win, so traditional text parses as it
+always did, and simplified or mixed-script text needs no conversion first.
+
+Those flags live in each record's tag, so `probe` decodes no entries at all.
+
+Since a lexicon holds everything the pipeline needs from both dictionaries,
+it's the one prebuilt index that `build_index.py` (or `load`, on first use)
+compiles straight from the two text files: see `build` and `load`. Its stamp
+is a checksum of both files' contents and `INDEX_VERSION`, so it stays valid
+when copied elsewhere (e.g., baked into a container image), and can be used
+even where the text files aren't.
+
+`lookup` decodes each headword's entries once and hands the same entry
+objects to every morpheme with that headword (up to `ENTRY_CACHE_SIZE`
+headwords), with their hanzi and reading strings interned, so a long text, or
+a long-running parse service, holds one copy of each entry rather than one per
+occurrence. Entries are still plain dicts and serialize as before.
+"""
+
+import collections
+import functools
+import hashlib
+import os.path
+import sys
+import typing
+from collections.abc import Mapping
+from cccanto import CantoEntry, parseFile as parseCantoFile
+from dictstore import MappedDict, SourceStamp, build as buildStore, openIfFresh
+from readings import ReadingEntry, parseFile as parseReadingsFile
+
+CANTO_DICT = 1  # source flag: a CC-Canto headword
+READINGS = 2  # source flag: a CC-Canto readings headword
+ANY_SOURCE = CANTO_DICT | READINGS
+SOURCE_BITS = 2  # tags hold the source flags in their low bits, `Hit.longest` above them
+ENTRY_CACHE_SIZE = 1 << 15  # headwords whose decoded entries `Lexicon.lookup` keeps
+INTERNED_FIELDS = ('hanzi', 'mandarin', 'cantonese')  # entry strings that recur across entries
+INDEX_VERSION = 1  # of prebuilt indexes: bump whenever `compileLexicon`'s output changes
+CHECKSUM_CHUNK = 1 << 20  # bytes of a source file to hash at a time
+
+
+class Hit(typing.NamedTuple):
+  "Everything a `Lexicon` knows about a string"
+  cantoDefinitions: list[CantoEntry]  # if it's a CC-Canto headword
+  cantoPinyins: list[ReadingEntry]  # if it's a readings headword
+  isKey: bool  # a headword of either dictionary
+  isPrefix: bool  # starts some headword (maybe itself)
+  longest: int  # length of the longest headword starting with it, or 0
+
+
+def sourcesStamp(*files: str) -> typing.Optional[SourceStamp]:
+  "A prebuilt index's stamp: a checksum of `files`' contents, and `INDEX_VERSION`"
+  digest = hashlib.blake2b(str(INDEX_VERSION).encode('utf8'), digest_size=8)
+  for file in files:
+    if not os.path.exists(file):
+      return None
+    with open(file, 'rb') as fid:
+      for chunk in iter(lambda: fid.read(CHECKSUM_CHUNK), b''):
+        digest.update(chunk)
+  # the checksum is signed to fit the header's mtime field
+  return (INDEX_VERSION, int.from_bytes(digest.digest(), 'little', signed=True))
+
+
+def compileLexicon(
+    cdict: Mapping[str, list[CantoEntry]],
+    readings: Mapping[str, list[ReadingEntry]],
+    cdictSimplified: Mapping[str, list[CantoEntry]] = {},
+    readingsSimplified: Mapping[str, list[ReadingEntry]] = {}
+) -> tuple[dict[str, list], dict[str, int]]:
+  """The values and tags of a lexicon store
+
+  Each headword, traditional or simplified, maps to `[cantoDefinitions,
+  cantoPinyins]`, and each prefix of a headword that isn't one itself maps to
+  `[]`. The simplified dicts are the second ones `cccanto.parseFile` and
+  `readings.parseFile` return.
+  """
+
+  def entries(traditional: Mapping[str, list], simplified: Mapping[str, list], word: str) -> list:
+    return traditional[word] if word in traditional else simplified.get(word, [])
+
+  sources: dict[str, int] = collections.defaultdict(int)
+  for words, source in [(cdict, CANTO_DICT), (cdictSimplified, CANTO_DICT), (readings, READINGS),
+                        (readingsSimplified, READINGS)]:
+    for word in words:
+      sources[word] |= source
+
+  longest: dict[str, int] = dict()
+  for word in sources:
+    for end in range(1, len(word) + 1):
+      prefix = word[:end]
+      if longest.get(prefix, 0) < len(word):
+        longest[prefix] = len(word)
+
+  values: dict[str, list] = dict()
+  tags: dict[str, int] = dict()
+  for prefix, length in longest.items():
+    source = sources.get(prefix, 0)
+    if source:
+      values[prefix] = [
+          entries(cdict, cdictSimplified, prefix) if source & CANTO_DICT else [],
+          entries(readings, readingsSimplified, prefix) if source & READINGS else [],
+      ]
+    else:
+      values[prefix] = []
+    tags[prefix] = source | length << SOURCE_BITS
+  return values, tags
+
+
+def internEntry(entry: dict) -> dict:
+  "`entry` with the strings that often recur interned, as a JSON object hook"
+  for field in INTERNED_FIELDS:
+    value = entry.get(field)
+    if isinstance(value, str):
+      entry[field] = sys.intern(value)
+  return entry
+
+
+class Lexicon:
+  "CC-Canto and its readings, indexed together: see the module docstring"
+
+  def __init__(self, store: MappedDict):
+    self.store = store
+    self._entries = functools.lru_cache(maxsize=ENTRY_CACHE_SIZE)(self._decodeEntries)
+
+  def _decodeEntries(self, i: int) -> tuple[list[CantoEntry], list[ReadingEntry]]:
+    cantoDefinitions, cantoPinyins = self.store.valueAt(i, internEntry)
+    return cantoDefinitions, cantoPinyins
+
+  def close(self) -> None:
+    self.store.close()
+
+  def probe(self, prefix: str, sources: int = ANY_SOURCE) -> tuple[bool, bool]:
+    """Whether `prefix` is a headword, and whether it starts any headword
+
+    With `sources` (`CANTO_DICT` or `READINGS`), the first flag is only true for
+    headwords of those dictionaries; the second is always about both. A
+    `Lexicon` is thus a `wordfill.PrefixIndex`, like `dictstore.MappedDict`.
+    """
+    i = self.store.find(prefix)
+    if i is None:
+      return (False, False)
+    return (bool(self.store.tagAt(i) & sources), True)
+
+  def lookup(self, word: str) -> Hit:
+    """Both dictionaries' entries for `word`, and its flags, with one binary search
+
+    The entry lists are shared with other lookups of `word`: don't modify them.
+    """
+    i = self.store.find(word)
+    if i is None:
+      return Hit([], [], False, False, 0)
+    tag = self.store.tagAt(i)
+    if tag & ANY_SOURCE:
+      cantoDefinitions, cantoPinyins = self._entries(i)
+      return Hit(cantoDefinitions, cantoPinyins, True, True, tag >> SOURCE_BITS)
+    return Hit([], [], False, True, tag >> SOURCE_BITS)
+
+
+def build(cccantoFile: str, readingsFile: str, path: str) -> int:
+  """Compile a prebuilt index at `path` from the two dictionaries' text files
+
+  Returns the number of keys in the index.
+  """
+  stamp = sourcesStamp(cccantoFile, readingsFile)
+  if stamp is None:
+    raise FileNotFoundError(cccantoFile if not os.path.exists(cccantoFile) else readingsFile)
+  cdict, cdictSimplified = parseCantoFile(cccantoFile)
+  readings, readingsSimplified = parseReadingsFile(readingsFile)
+  values, tags = compileLexicon(cdict, readings, cdictSimplified, readingsSimplified)
+  buildStore(path, values, stamp, tags)
+  return len(values)
+
+
+def load(path: str, cccantoFile: str, readingsFile: str) -> Lexicon:
+  """Open the prebuilt index at `path`, (re)building it if it's missing or stale
+
+  If both text files are present, the index is rebuilt unless it was built
+  from exactly their contents. If either is missing, any index of this
+  `INDEX_VERSION` is used as-is.
+  """
+  stamp = sourcesStamp(cccantoFile, readingsFile)
+  store = openIfFresh(path, stamp)
+  if store is not None and store.stamp[0] != INDEX_VERSION:
+    store.close()
+    raise ValueError(f'{path} is an old index: rebuild it with build_index.py')
+  if store is None:
+    if stamp is None:
+      raise FileNotFoundError(path)
+    build(cccantoFile, readingsFile, path)
+    store = MappedDict(path)
+  return Lexicon(store)
+
+
+if __name__ == '__main__':
+  import os.path
+  import tempfile
+
+  with tempfile.TemporaryDirectory() as tmp:
+    cccantoFile, readingsFile, index = (os.path.join(tmp, f) for f in ('c.txt', 'r.txt', 'i.bin'))
+    reload = lambda: load(index, cccantoFile, readingsFile)
+    with open(cccantoFile, 'w') as fid:
+      fid.write('精神 精神 [jing1 shen2] {zing1 san4} /spirit/\n')
+      fid.write('精神病 精神病 [jing1 shen2 bing4] {zing1 san4 beng6} /mental illness/\n')
+    with open(readingsFile, 'w') as fid:
+      fid.write('精神 精神 [jing1 shen2] {zing1 san4}\n')
+      fid.write('神 神 [shen2] {san4}\n')
+    cdict = parseCantoFile(cccantoFile)[0]
+    readings = parseReadingsFile(readingsFile)[0]
+
+    lexicon = reload()
+    hit = lexicon.lookup('精神')
+    assert hit == Hit(cdict['精神'], readings['精神'], True, True, 3), hit
+    assert lexicon.lookup('精') == Hit([], [], False, True, 3)
+    assert lexicon.lookup('神') == Hit([], readings['神'], True, True, 1)
+    assert lexicon.lookup('病') == Hit([], [], False, False, 0)
+    assert lexicon.probe('神') == (True, True)
+    assert lexicon.probe('神', CANTO_DICT) == (False, True)
+    assert lexicon.lookup('神').cantoPinyins[0]['cantonese'] == 'san4'
+    lexicon.close()
+
+    with open(readingsFile, 'w') as fid:
+      fid.write('神 神 [shen2] {san6}\n')  # stale: rebuilt
+    assert reload().lookup('神').cantoPinyins[0]['cantonese'] == 'san6'
+    os.remove(readingsFile)  # missing: used as-is
+    assert reload().lookup('精神').isKey
+  print("Success!")
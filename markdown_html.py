@@ -0,0 +1,164 @@
+"""
+Pure-Python HTML for the Markdown we generate
+
+`parsed_to_md.py` and `editor_server.py` produce a very small subset of
+Markdown: `#` headings, paragraphs, and bulleted lists nested by two spaces,
+all with raw HTML (ruby markup) inline. Converting that with pandoc means a
+subprocess per page; this converts just that subset in-process, into a
+standalone HTML5 page similar to pandoc's `-s` output.
+
+Like pandoc's `hard_line_breaks` extension, newlines inside a paragraph become
+`<br />`. The inline HTML we generate (see `render.resolutionToRuby`) and
+character references are passed through untouched, and, as pandoc does, any
+other `&`, `<` and `>` are escaped. Anything fancier (emphasis,
+links, metadata blocks, …) isn't supported: use pandoc for that, with `pandoc`
+or, for many documents, `pandocPages`, which converts them all with one
+pandoc run. Only those need `pypandoc`.
+"""
+
+import html
+import re
+
+PANDOC_FROM = 'markdown_github+hard_line_breaks+yaml_metadata_block+markdown_in_html_blocks+auto_identifiers'
+PANDOC_EXTRA_ARGS = ['-s', '--metadata', 'pagetitle=Cantonese']
+# separates documents converted together by `pandocPages`: raw HTML, so pandoc passes it through
+PANDOC_SEPARATOR = '<!-- cantopolitan: next document -->'
+
+HEADING = re.compile(r'(#{1,6})\s+(.*)')
+BULLET = re.compile(r'( *)[-*+]\s+(.*)')
+# our ruby markup's tags, and character references: everything else is escaped
+RAW_INLINE = re.compile(
+    r'(</?(?:ruby|rt|sup)>|&(?:#[0-9]+|#[xX][0-9a-fA-F]+|[A-Za-z][A-Za-z0-9]*);)')
+
+PAGE = '''<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" lang="" xml:lang="">
+<head>
+  <meta charset="utf-8" />
+  <meta name="viewport" content="width=device-width, initial-scale=1.0, user-scalable=yes" />
+  <title>{title}</title>
+</head>
+<body>
+{body}
+</body>
+</html>
+'''
+
+
+def inlineHtml(text: str) -> str:
+  "Escape `text` for HTML, except for `RAW_INLINE` markup"
+  return ''.join(piece if i % 2 else html.escape(piece, quote=False)
+                 for i, piece in enumerate(RAW_INLINE.split(text)))
+
+
+def markdownToHtmlBody(markdown: str) -> str:
+  "Convert our Markdown subset to HTML, without the surrounding page"
+  out: list[str] = []
+  paragraph: list[str] = []
+  openLists = 0  # nesting depth of currently open <ul>s
+
+  def closeParagraph():
+    if paragraph:
+      out.append('<p>' + '<br />\n'.join(paragraph) + '</p>')
+      paragraph.clear()
+
+  def closeLists(depth: int):
+    nonlocal openLists
+    while openLists > depth:
+      out.append('</li>\n</ul>')
+      openLists -= 1
+
+  for line in markdown.split('\n'):
+    if len(line.strip()) == 0:
+      closeParagraph()
+      closeLists(0)
+      continue
+
+    heading = HEADING.fullmatch(line)
+    if heading:
+      closeParagraph()
+      closeLists(0)
+      level = len(heading.group(1))
+      out.append(f'<h{level}>{inlineHtml(heading.group(2).strip())}</h{level}>')
+      continue
+
+    bullet = BULLET.fullmatch(line)
+    if bullet:
+      closeParagraph()
+      depth = len(bullet.group(1)) // 2 + 1
+      if depth > openLists:
+        while openLists < depth:
+          out.append('<ul>')
+          openLists += 1
+      else:
+        closeLists(depth)
+        out.append('</li>')
+      out.append(f'<li>{inlineHtml(bullet.group(2))}')
+      continue
+
+    if openLists:
+      # continuation of the last list item
+      out[-1] += '<br />\n' + inlineHtml(line.strip())
+    else:
+      paragraph.append(inlineHtml(line.strip()))
+
+  closeParagraph()
+  closeLists(0)
+  return '\n'.join(out)
+
+
+def htmlPage(body: str, title: str = 'Cantonese') -> str:
+  "Wrap converted HTML in a standalone page"
+  return PAGE.format(title=title, body=body)
+
+
+def markdownToHtml(markdown: str, title: str = 'Cantonese') -> str:
+  "Convert our Markdown subset to a standalone HTML page"
+  return htmlPage(markdownToHtmlBody(markdown), title)
+
+
+def pandoc(markdown: str) -> str:
+  "Convert Markdown to a standalone HTML page with pandoc"
+  from pypandoc import convert_text
+  return convert_text(markdown, to='html5', format=PANDOC_FROM, extra_args=PANDOC_EXTRA_ARGS)
+
+
+def pandocPages(markdowns: list[str], title: str = 'Cantonese') -> list[str]:
+  """Convert many Markdown documents to standalone HTML pages with a single pandoc run
+
+  Pandoc converts the documents together, without its `-s`, into one body,
+  which is split back into each document's, and `htmlPage` makes each a page.
+  Heading identifiers are therefore unique across all the documents, not just
+  within each one.
+  """
+  from pypandoc import convert_text
+  if not markdowns:
+    return []
+  markdown = f'\n\n{PANDOC_SEPARATOR}\n\n'.join(markdowns)
+  html = convert_text(markdown, to='html5', format=PANDOC_FROM, extra_args=[])
+  bodies = html.split(PANDOC_SEPARATOR)
+  if len(bodies) != len(markdowns):
+    raise ValueError(f'pandoc gave {len(bodies)} documents for {len(markdowns)}')
+  return [htmlPage(body.strip(), title) for body in bodies]
+
+
+if __name__ == '__main__':
+  body = markdownToHtmlBody('## <ruby>大<rt>daai6</rt></ruby>\n- a\n  - b\n  - c\n- d\nx\ny')
+  expected = '''<h2><ruby>大<rt>daai6</rt></ruby></h2>
+<ul>
+<li>a
+<ul>
+<li>b
+</li>
+<li>c
+</li>
+</ul>
+</li>
+<li>d<br />
+x<br />
+y
+</li>
+</ul>'''
+  assert body == expected, body
+  body = markdownToHtmlBody('<ruby>A&B<rt>x</rt></ruby> & <b> &amp; 1<2')
+  assert body == '<p><ruby>A&amp;B<rt>x</rt></ruby> &amp; &lt;b&gt; &amp; 1&lt;2</p>', body
+  print("Success!")
@@ -1,15 +1,43 @@
-from chinese import ChineseAnalyzer
-from readings import ReadingEntry, init as initReadings
-from cccanto import CantoEntry, init as initDict
-import itertools as it
+import atexit
+import collections
+import difflib
+import itertools
+import json
+import multiprocessing
+import multiprocessing.pool
+import os
+import os.path
+import sys
 import typing
-import re
-from cache_analysis import cache_analysis
-from wordfill import fill as wordfill
+from cache_analysis import AnalysisCache, resultDumps, resultLoads
+from compact import compactMorphemes
+from dictsegment import DictionaryAnalyzer
+from input_files import outputFiles
+from jsonstream import iterMorphemes
+from build_index import CCCANTO_FILE, INDEX_FILE, READINGS_FILE
+from lexicon import CANTO_DICT, Lexicon, load as loadLexicon
+from profiling import NULL_PROFILE, Profile
+from render import (Morpheme, MorphemeFields, Resolution, cantoneseToHtml, morphemeToBulletedDefs,
+                    morphemeToRuby, resolutionToRuby, resolveReading, splitTone)
+from wordfill import Segmenter
 
-readings = initReadings('cccedict-canto-readings-150923.txt')
-cdict = initDict('cccanto-webdist.txt')
-ANALYSIS_CACHE_FILE = 'analysis_cache.pickle'
+ANALYSIS_CACHE_DIR = 'analysis_cache'  # see `cache_analysis.AnalysisCache`
+_lexicon: typing.Optional[Lexicon] = None
+
+
+def defaultLexicon() -> Lexicon:
+  "The prebuilt index (see `build_index.py`), loaded on first use and built first if need be"
+  global _lexicon
+  if _lexicon is None:
+    _lexicon = loadLexicon(INDEX_FILE, CCCANTO_FILE, READINGS_FILE)
+  return _lexicon
+
+
+def __getattr__(name: str):
+  # `parse.lexicon` is `defaultLexicon()`, so merely importing this module loads nothing
+  if name == 'lexicon':
+    return defaultLexicon()
+  raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def cleanPinyin(pinyin: typing.Optional[list[str]]) -> typing.Optional[str]:
@@ -24,22 +52,6 @@ def noneSetToNone(s: set[typing.Optional[str]]) -> typing.Optional[set[str]]:
   return {elt for elt in s if elt is not None}
 
 
-class Morpheme(typing.TypedDict):
-  hanzi: str
-
-  # Jieba's hits per token, so at least 1, maybe more; all maybe None
-  pinyins: list[typing.Optional[str]]
-  definitions: list[typing.Optional[list[str]]]  # inner list: separate sub-meanings
-
-  cantoDefinitions: list[CantoEntry]  # matched by hanzi
-  cantoPinyins: list[ReadingEntry]  # also matched by hanzi but for comparison to pinyins
-  # N.B., len(cantoDefinitions) might be != len(cantoPinyins)!
-
-  merged: bool  # should default to false if from Jieba; when we create a new morpheme from multiple ones, set this to true
-  hidden: bool  # should default to false if from Jieba; when a merged morpheme overshadows a Jieba morpheme, hide the latter
-  guessed: bool  # should default to false if from Jieba
-
-
 def initMorpheme(hanzi: str,
                  cantoDefinitions=[],
                  cantoPinyins=[],
@@ -57,198 +69,581 @@ def initMorpheme(hanzi: str,
       guessed=guessed)
 
 
-def allSubwords(s: str):
-  """
-  Given a string, return an iterator that gives all contiguous substrings.
-
-  For `abc`, you get
-  - `a`
-  - `ab`
-  - `abc`
-  - `b`
-  - `bc`
-  - `c`
-  """
-  return it.chain.from_iterable(it.accumulate(s[i:]) for i in range(len(s)))
+def guessNotNeeded(m: Morpheme) -> bool:
+  return bool(
+      len(m['cantoDefinitions']) or len(m['cantoPinyins']) or m['hidden'] or
+      0 == len(m['hanzi'].strip()))
 
 
 # There are going to be words where we didn't find Cantonese readings.
 # Break down these morphemes into individual pieces and try to find dictionary entries for these.
 # Prefer the longest dictionary hit. This is risky!
-def guessMissingReadings(morphemes: list[Morpheme]):
-  # Step 1: build a small dictionary of all sub-words (spanning morpheme boundaries)
-  guessNotNeededPredicate: typing.Callable[[Morpheme], bool] = lambda m: bool(
-      len(m['cantoDefinitions']) or len(m['cantoPinyins']) or m['hidden'] or 0 == len(m['hanzi'].
-                                                                                      strip()))
-  missing: set[str] = set()
-  for i, morpheme in enumerate(morphemes):
-    if guessNotNeededPredicate(morpheme):
-      continue
-    adjacent = list(it.takewhile(lambda m: not guessNotNeededPredicate(m), morphemes[i:]))
-    for hanzi in allSubwords("".join(m['hanzi'] for m in adjacent)):
-      if hanzi in missing:
-        continue
-      if hanzi in cdict or hanzi in readings:
-        missing.add(hanzi)
-
-  # Step 2: find the largest words to "fill" a morpheme
-  i = 0
-  while i < len(morphemes):
-    morpheme = morphemes[i]
-    if guessNotNeededPredicate(morpheme):
-      i += 1
-      continue
-    found = [k for k in allSubwords(morpheme['hanzi']) if k in missing]
-    mash = "".join(found)
-    if not all(char in mash for char in morpheme['hanzi']):
-      i += 1
-      continue
-    # we have a hit for all characters in hanzi. Fill in the "biggest" first, greedily
-    pieces = wordfill(morpheme['hanzi'], found)
+def guessMissingReadings(morphemes: list[Morpheme], lexicon: Lexicon) -> list[Morpheme]:
+  """Split morphemes without readings into dictionary words, where possible
+
+  Returns a new list where each such morpheme that can be covered by
+  dictionary words is `hidden` and preceded by `guessed` morphemes for those
+  words (see `guessPieces`).
+  """
+  segmenter = Segmenter(lexicon)
+  ret: list[Morpheme] = []
+  for morpheme in morphemes:
+    if not guessNotNeeded(morpheme):
+      ret.extend(guessPieces(morpheme, lexicon, segmenter))
+    ret.append(morpheme)
+  return ret
 
-    morphemes[i]['hidden'] = True
 
-    newMorphemes: list[Morpheme] = []
-    for p in pieces:
-      m = initMorpheme(p, guessed=True)
-      if p in cdict:
-        m['cantoDefinitions'] = cdict[p]
-      if p in readings:
-        m['cantoPinyins'] = readings[p]
-      newMorphemes.append(m)
+def guessPieces(morpheme: Morpheme, lexicon: Lexicon, segmenter: Segmenter) -> list[Morpheme]:
+  """Guessed morphemes that together spell `morpheme`, which is then hidden
+
+  `segmenter` splits the hanzi into dictionary words, preferring the biggest
+  pieces. If the dictionaries can't cover it, returns no pieces and leaves
+  `morpheme` alone.
+  """
+  try:
+    pieces = segmenter.segment(morpheme['hanzi'])
+  except ValueError:
+    return []
 
-    morphemes[i:i] = newMorphemes
+  morpheme['hidden'] = True
 
-    i += len(newMorphemes) + 1
+  newMorphemes: list[Morpheme] = []
+  for p in pieces:
+    hit = lexicon.lookup(p)
+    newMorphemes.append(
+        initMorpheme(
+            p, cantoDefinitions=hit.cantoDefinitions, cantoPinyins=hit.cantoPinyins, guessed=True))
+  return newMorphemes
 
 
 ChineseAnalyzerResult = typing.Any
+ENGINES = ('analyzer', 'dictionary')  # see `Pipeline`
+
+
+class Pipeline:
+  """Long-lived parser owning a Chinese analyzer, the dictionaries and the analysis cache
+
+  Build one and call `parse` (or `parseMany`) as often as needed: the analyzer
+  is constructed once, and the analysis cache is loaded once and only written
+  back to disk on `flush` or `close` (or after every `flushEvery` new analyses,
+  if given). Use it as a context manager to close it automatically:
+
+  >>> with Pipeline() as pipeline:
+  >>>   for morphemes in pipeline.parseMany(paragraphs):
+  >>>     print(json.dumps(morphemes))
+
+  The dictionaries default to `defaultLexicon()`. Analyses are cached in the
+  `cacheFile` directory, which other processes may be using too (see
+  `cache_analysis.AnalysisCache`): pass `cacheFile=None` to not cache analyses
+  at all. Pass a `profiling.Profile` to
+  record time spent per stage and count lookups, cache hits, merges, etc.
+
+  With `engine='dictionary'`, text is segmented by a
+  `dictsegment.DictionaryAnalyzer` over the lexicon instead of the Chinese
+  analyzer, which is then never imported. That's quick enough that analyses
+  aren't cached.
+  """
+
+  def __init__(self,
+               lexicon: typing.Optional[Lexicon] = None,
+               cacheFile: typing.Optional[str] = ANALYSIS_CACHE_DIR,
+               flushEvery: typing.Optional[int] = None,
+               profile: Profile = NULL_PROFILE,
+               engine: str = 'analyzer'):
+    if engine not in ENGINES:
+      raise ValueError(f'engine must be one of {ENGINES}')
+    self.profile = profile
+    self.engine = engine
+    if lexicon is None:
+      with profile.stage('dictionary loading'):
+        lexicon = defaultLexicon()
+    self.lexicon = profile.countLookups(lexicon, 'lexicon lookups')
+    with profile.stage('analyzer startup'):
+      if engine == 'dictionary':
+        self.analyzer = DictionaryAnalyzer(self.lexicon)
+        cacheFile = None
+      else:
+        from chinese import ChineseAnalyzer
+        self.analyzer = ChineseAnalyzer()
+    with profile.stage('cache'):
+      self.cache = None if cacheFile is None else AnalysisCache(
+          cacheFile, self.analyzer, flushEvery=flushEvery)
+
+  def analyze(self, text: str) -> ChineseAnalyzerResult:
+    "Run the Chinese analyzer on `text`, or fetch its cached result"
+    profile = self.profile
+    if self.cache is None:
+      with profile.stage('analyzer'):
+        return self.analyzer.parse(text, traditional=True)
+    with profile.stage('cache'):
+      result = self.cache.get(text)
+    if result is not None:
+      profile.count('cache hits')
+      return result
+    profile.count('cache misses')
+    with profile.stage('analyzer'):
+      result = self.analyzer.parse(text, traditional=True)
+    with profile.stage('cache'):
+      self.cache[text] = result
+    return result
+
+  def parse(self, text: str) -> list[Morpheme]:
+    return self.parseResult(self.analyze(text))
+
+  def parseResult(self, result: ChineseAnalyzerResult) -> list[Morpheme]:
+    "Turn a Chinese analyzer result into morphemes with Cantonese readings"
+    profile = self.profile
+    with profile.stage('lookup'):
+      morphemes = self.tokenMorphemes(result)
+
+    # This list of morphemes may have a few things wrong with it:
+    # 1. Instead of one morpheme object per real morpheme, Jieba might have given us TWO or more. We need the user to downselect for us.
+    # 2. We might be able to consolidate multiple morphemes into a single one if we find a run of them in the CC-Canto.
+    # 3. We *definitely* don't have any Cantonese readings
+
+    # Let's try to do #2: loop thru the list of tokens and see if we can consolidate more than one element
+    with profile.stage('merge'):
+      morphemes = mergeDictionaryRuns(morphemes, self.lexicon)
+
+    if profile.enabled:
+      profile.count('morphemes', len(morphemes))
+      profile.count('merges', sum(1 for m in morphemes if m['merged']))
+      profile.count('wordfill calls', sum(1 for m in morphemes if not guessNotNeeded(m)))
+    with profile.stage('guess'):
+      morphemes = guessMissingReadings(morphemes, self.lexicon)
+    if profile.enabled:
+      profile.count('guessed morphemes', sum(1 for m in morphemes if m['guessed']))
+    return morphemes
+
+  def tokenMorphemes(self, result: ChineseAnalyzerResult) -> list[Morpheme]:
+    """One morpheme per token of a Chinese analyzer result, with its dictionary hits
+
+    Tokens and pinyin recur constantly, so they're interned, and dictionary
+    entries are shared by the lexicon: a long text's morphemes don't each
+    carry their own copies.
+    """
+    lexicon = self.lexicon
+
+    morphemes: list[Morpheme] = []
+    for token in result.tokens():
+      morpheme = initMorpheme(sys.intern(token))
+      for hit in result[token]:
+        morpheme['pinyins'].append(sys.intern(cleanPinyin(hit.pinyin)) if hit.pinyin else None)
+        morpheme['definitions'].append(hit.definitions)
+      hit = lexicon.lookup(token)
+      morpheme['cantoDefinitions'] = hit.cantoDefinitions
+      morpheme['cantoPinyins'] = hit.cantoPinyins
+      morphemes.append(morpheme)
+    return morphemes
+
+  def parseMany(self, texts: typing.Iterable[str]) -> typing.Iterator[list[Morpheme]]:
+    "Lazily parse each of `texts`"
+    for text in texts:
+      yield self.parse(text)
+
+  def reparse(self, oldText: str, oldMorphemes: list[Morpheme], newText: str) -> list[Morpheme]:
+    """Parse `newText`, an edited `oldText`, reusing the morphemes of unchanged paragraphs
+
+    `oldMorphemes` is what parsing `oldText` gave (maybe since edited, e.g., in
+    `editor_server.py`). Both texts are split into lines (see `paragraphs` and
+    `splitParagraphs`), and only lines that were added or changed are parsed,
+    one at a time, like `--ndjson` does, so the work is proportional to the
+    edit. The rest keep their old morphemes, edits and all. If `oldMorphemes`
+    don't spell out `oldText`, everything is parsed afresh.
+    """
+    try:
+      old = splitParagraphs(oldText, oldMorphemes)
+    except ValueError:
+      return self.parse(newText)
+    new = list(paragraphs(newText.splitlines(keepends=True)))
+
+    morphemes: list[Morpheme] = []
+    matcher = difflib.SequenceMatcher(None, [text for text, _ in old], new, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+      if tag == 'equal':
+        self.profile.count('reused paragraphs', i2 - i1)
+        for _, paragraphMorphemes in old[i1:i2]:
+          morphemes.extend(paragraphMorphemes)
+      else:
+        self.profile.count('reparsed paragraphs', j2 - j1)
+        for paragraphMorphemes in self.parseMany(new[j1:j2]):
+          morphemes.extend(paragraphMorphemes)
+    return morphemes
+
+  def flush(self):
+    "Save new analyses to the cache file"
+    if self.cache is not None:
+      with self.profile.stage('cache'):
+        self.cache.flush()
+
+  def close(self):
+    if self.cache is not None:
+      with self.profile.stage('cache'):
+        self.cache.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+_defaultPipeline: typing.Optional[Pipeline] = None
+
+
+def defaultPipeline() -> Pipeline:
+  "The shared `Pipeline`, created on first use and closed when the program exits"
+  global _defaultPipeline
+  if _defaultPipeline is None:
+    _defaultPipeline = Pipeline()
+    atexit.register(_defaultPipeline.close)
+  return _defaultPipeline
 
 
 def parseTextToMorphemes(line: str) -> list[Morpheme]:
-  analyzer = ChineseAnalyzer()
-
-  with cache_analysis(ANALYSIS_CACHE_FILE, analyzer) as cache:
-    if line in cache:
-      result = cache[line]
-    else:
-      result = analyzer.parse(line, traditional=True)
-      cache[line] = result
-
-  morphemes: list[Morpheme] = []
-  for token in result.tokens():
-    morpheme = initMorpheme(token)
-    for hit in result[token]:
-      morpheme['pinyins'].append(cleanPinyin(hit.pinyin) if hit.pinyin else None)
-      morpheme['definitions'].append(hit.definitions)
-    morpheme['cantoDefinitions'] = cdict[token] if token in cdict else []
-    morpheme['cantoPinyins'] = readings[token] if token in readings else []
-    morphemes.append(morpheme)
-
-  # This list of morphemes may have a few things wrong with it:
-  # 1. Instead of one morpheme object per real morpheme, Jieba might have given us TWO or more. We need the user to downselect for us.
-  # 2. We might be able to consolidate multiple morphemes into a single one if we find a run of them in the CC-Canto.
-  # 3. We *definitely* don't have any Cantonese readings
-
-  # Let's try to do #2: loop thru the list of tokens and see if we can consolidate more than one element
+  return defaultPipeline().parse(line)
+
+
+def mergeDictionaryRuns(morphemes: list[Morpheme], lexicon: Lexicon) -> list[Morpheme]:
+  """Consolidate runs of morphemes whose joined hanzi is in CC-Canto
+
+  At each position, find the longest run of two or more morphemes whose hanzi
+  is a CC-Canto headword. If found, emit a new `merged` morpheme followed by the
+  run's morphemes, now `hidden`, and continue after the run.
+
+  We only walk forward while the accumulated hanzi is a prefix of some
+  headword, so each position costs at most the length of the longest
+  headword, instead of the rest of the document.
+  """
+  ret: list[Morpheme] = []
   startIdx = 0
   while startIdx < len(morphemes):
     numAccumulated = 0
-
-    accumulatingHanzi: enumerate[str] = enumerate(
-        it.accumulate(m['hanzi'] for m in morphemes[startIdx:]))
-    accumulatingEntries = [(idx, cdict[h] if h in cdict else None) for (idx, h) in accumulatingHanzi
-                          ]
-    # find longest run of morphemes' hanzi in dictionary
-    for idx, entries in reversed(accumulatingEntries):
-      if entries is None:
-        continue
-      # first non-None entry
-      if idx == 0:
-        # same hits as above, longer hit not found
+    longestHanzi = ''
+    hanzi = ''
+    for idx in range(startIdx, len(morphemes)):
+      hanzi += morphemes[idx]['hanzi']
+      isKey, isPrefix = lexicon.probe(hanzi, CANTO_DICT)
+      if not isPrefix:
         break
-      # longest non-boring hit found!
+      if isKey:
+        numAccumulated = idx - startIdx + 1
+        longestHanzi = hanzi
+
+    if numAccumulated < 2:
+      # no hit, or same hit as the single morpheme already has
+      ret.append(morphemes[startIdx])
+      startIdx += 1
+      continue
 
-      numAccumulated = idx + 1
-      for oldMorpheme in morphemes[startIdx:startIdx + numAccumulated]:
-        oldMorpheme['hidden'] = True
+    # longest non-boring hit found!
+    entries = lexicon.lookup(longestHanzi).cantoDefinitions
+    # as written in the text, which may be a simplified headword of traditional entries
+    ret.append(initMorpheme(longestHanzi, cantoDefinitions=entries, merged=True))
+    for oldMorpheme in morphemes[startIdx:startIdx + numAccumulated]:
+      oldMorpheme['hidden'] = True
+      ret.append(oldMorpheme)
+    startIdx += numAccumulated
 
-      newMorpheme = initMorpheme(entries[0]['hanzi'], cantoDefinitions=entries, merged=True)
+  return ret
 
-      morphemes.insert(startIdx, newMorpheme)
-      break
 
-    startIdx += (numAccumulated + 1)
-    # skip all accumulated morphemes and the one we just inserted
+# Each process in a `workerPool` gets its own uncached `Pipeline`
+_workerPipeline: typing.Optional[Pipeline] = None
 
-  guessMissingReadings(morphemes)
 
-  return morphemes
+def _initWorker(engine: str):
+  global _workerPipeline
+  _workerPipeline = Pipeline(cacheFile=None, engine=engine)
 
 
-def cantoneseToHtml(c: str, prefix='', suffix='') -> str:
-  num = re.compile('[0-9]$')
-  match = num.search(c)
-  if not match:
-    return c
-  word = c[:match.start()]
-  tone = c[match.start():]
-  return f'{prefix}{word}<sup>{tone}{suffix}</sup>'
+def workerPool(jobs: typing.Optional[int] = None,
+               engine: str = 'analyzer') -> multiprocessing.pool.Pool:
+  """A pool of `jobs` processes (default: one per core) for `parseInWorker`
 
+  Each worker has its own `Pipeline` with the given `engine`, so its own
+  `ChineseAnalyzer` by default. Where the platform allows, workers are forked
+  so they share the already loaded, memory-mapped dictionaries.
+  """
+  defaultLexicon()  # load (or build) it once, before forking
+  methods = multiprocessing.get_all_start_methods()
+  context = multiprocessing.get_context('fork' if 'fork' in methods else None)
+  return context.Pool(jobs or os.cpu_count() or 1, initializer=_initWorker, initargs=(engine,))
 
-def morphemeToRuby(m: Morpheme) -> str:
-  if m['hidden']:
-    return ''
-  if len(m['cantoDefinitions']) == 0 and len(m['cantoPinyins']) == 0:
-    return m['hanzi']
 
-  pinyins = set(p for p in m['pinyins'] if p)
-  allCantos: set[str] = set()
-  if len(pinyins):
-    for d in m['cantoDefinitions']:
-      if d['mandarin'] in pinyins:
-        allCantos.add(d['cantonese'])
-    for r in m['cantoPinyins']:
-      if r['mandarin'] in pinyins:
-        allCantos.add(r['cantonese'])
-  else:
-    for d in m['cantoDefinitions']:
-      allCantos.add(d['cantonese'])
-    for r in m['cantoPinyins']:
-      allCantos.add(r['cantonese'])
-
-  more = '' if len(allCantos) == 1 else '<sup>+</sup>'
-  guess = '¿' if m['guessed'] else ''
-  canto: str = min(allCantos, default='unknown')
-  cantos = canto.split(' ')
-  if len(cantos) == len(m['hanzi']):
-    hanzis = iter(m['hanzi'])
-    return "".join(f"<ruby>{h}<rt>{cantoneseToHtml(c, prefix=guess, suffix=more)}</rt></ruby>"
-                   for h, c in zip(hanzis, cantos))
-
-  canto = canto.replace(' ', '')
-  return f'<ruby>{m["hanzi"]}<rt>{guess}{canto}{more}</rt></ruby>'
-
-
-def lenNotNone(l: list) -> int:
-  return sum(1 for x in l if x is not None)
-
-
-def morphemeToBulletedDefs(m: Morpheme) -> str:
-  if m['hidden'] or (len(m['cantoDefinitions']) == 0 and lenNotNone(m['definitions']) == 0):
-    return ''
-  markdown = f"- {morphemeToRuby(m)}\n"
-  if len(m['cantoDefinitions']):
-    sub = [f'  - {d["cantonese"]} : {d["definition"]}' for d in m['cantoDefinitions']]
+def parseInWorker(
+    job: tuple[str, typing.Optional[bytes]]) -> tuple[list[Morpheme], typing.Optional[bytes]]:
+  """Parse `text` in a `workerPool` process
+
+  Uses the serialized analysis `cached` if available. Otherwise, also returns
+  the text's serialized analysis (for the default engine) so the calling
+  process can cache it: workers never touch the analysis cache themselves.
+  """
+  text, cached = job
+  assert _workerPipeline is not None
+  analyzer = _workerPipeline.analyzer
+  fresh = None
+  if cached is None:
+    result = analyzer.parse(text, traditional=True)
+    if _workerPipeline.engine == 'analyzer':
+      fresh = resultDumps(result)
   else:
-    sub = ['  - ' + " / ".join(d) for d in m['definitions'] if d is not None]
-  return markdown + '\n'.join(sub)
+    result = resultLoads(cached, analyzer)
+  return _workerPipeline.parseResult(result), fresh
+
+
+def _parseFileWorker(job: tuple[str, str, typing.Optional[bytes], bool]):
+  "Parse one file's text to `outPath`, returning the text and any fresh analysis to cache"
+  text, outPath, cached, compact = job
+  morphemes, fresh = parseInWorker((text, cached))
+  with open(outPath, 'w') as fid:
+    json.dump(compactMorphemes(morphemes) if compact else morphemes, fid)
+  return None if fresh is None else (text, fresh)
+
+
+def parseFiles(paths: typing.Iterable[str],
+               jobs: typing.Optional[int] = None,
+               outDir: typing.Optional[str] = None,
+               cacheFile: str = ANALYSIS_CACHE_DIR,
+               compact: bool = False,
+               engine: str = 'analyzer') -> int:
+  """Parse many text files in parallel, writing one JSON file per input
+
+  `paths` may include directories, whose `.txt` files are all parsed (see
+  `input_files.outputFiles`). With `compact`, writes
+  `compact.CompactDocument`s. Work is spread over a `workerPool` of `jobs`
+  processes, using the `Pipeline` `engine`.
+
+  Only this process touches the analysis cache: it looks up each text before
+  dispatching it and stores the analyses workers send back, so concurrent
+  workers never race to write the cache.
+
+  Returns the number of files parsed.
+  """
+  files = outputFiles(paths, outDir)
+  numJobs = jobs or os.cpu_count() or 1
+  done = 0
+  # start the workers before opening the cache so they don't inherit its connection
+  with workerPool(numJobs, engine) as pool:
+    cache = AnalysisCache(cacheFile, None) if engine == 'analyzer' else None
+    try:
+      # keep a few files in flight per worker, without reading every file up front
+      pending: collections.deque = collections.deque()
+      for path, outPath in files:
+        with open(path, 'r') as fid:
+          text = fid.read()
+        job = (text, outPath, cache.getData(text) if cache else None, compact)
+        pending.append(pool.apply_async(_parseFileWorker, (job,)))
+        if len(pending) >= 4 * numJobs:
+          fresh = pending.popleft().get()
+          if cache and fresh is not None:
+            cache.setData(*fresh)
+          done += 1
+      while pending:
+        fresh = pending.popleft().get()
+        if cache and fresh is not None:
+          cache.setData(*fresh)
+        done += 1
+    finally:
+      if cache:
+        cache.close()
+  return done
+
+
+def paragraphs(lines: typing.Iterable[str]) -> typing.Iterator[str]:
+  """Group lines into paragraphs: each line, with any blank lines right after it
+
+  Joining the paragraphs gives back the input exactly, so no newline morphemes
+  are lost. No dictionary headword spans a newline, so breaking at every line
+  splits no words, and only one line (and the blank lines after it) is held in
+  memory at a time.
+  """
+  buffer: list[str] = []
+  for line in lines:
+    if buffer and len(line.strip()) > 0:
+      yield "".join(buffer)
+      buffer = []
+    buffer.append(line)
+  if buffer:
+    yield "".join(buffer)
+
+
+def splitParagraphs(text: str, morphemes: list[Morpheme]) -> list[tuple[str, list[Morpheme]]]:
+  """Split a parsed text and its morphemes into paragraphs, i.e., lines (see `paragraphs`)
+
+  The analyzer's tokens, i.e., morphemes that aren't `merged` or `guessed`,
+  spell out the text, so they place the paragraph breaks. Merged and guessed
+  morphemes go with the token after them (the first one they stand for). If a
+  token straddles a paragraph break, those paragraphs stay together.
+
+  Raises `ValueError` if the tokens don't spell out `text`.
+  """
+  breaks = set(itertools.accumulate(len(p) for p in paragraphs(text.splitlines(keepends=True))))
+  ret: list[tuple[str, list[Morpheme]]] = []
+  group: list[Morpheme] = []
+  start = end = 0
+  for m in morphemes:
+    group.append(m)
+    if m['merged'] or m['guessed']:
+      continue
+    if not text.startswith(m['hanzi'], end):
+      raise ValueError(f'morphemes differ from the text at {end}')
+    end += len(m['hanzi'])
+    if end in breaks:
+      ret.append((text[start:end], group))
+      group = []
+      start = end
+  if end != len(text) or group:
+    raise ValueError('morphemes and text have different lengths')
+  return ret
+
+
+def selfCheck():
+  "Asserts over tiny dictionaries in a temporary directory, for `python parse.py --self-check`"
+  import tempfile
+
+  # every line is a paragraph, so text without blank lines still streams
+  assert list(paragraphs(['一\n', '二\n', '三'])) == ['一\n', '二\n', '三']
+  assert list(paragraphs(['\n', '一\n', '\n', ' \n', '二\n'])) == ['\n', '一\n\n \n', '二\n']
+
+  with tempfile.TemporaryDirectory() as tmp:
+    cccantoFile, readingsFile = os.path.join(tmp, 'cccanto.txt'), os.path.join(tmp, 'readings.txt')
+    with open(cccantoFile, 'w') as fid:
+      fid.write('廣東話 广东话 [guang3 dong1 hua4] {gwong2 dung1 waa2} /Cantonese/\n')
+    with open(readingsFile, 'w') as fid:
+      fid.write('話 话 [hua4] {waa2}\n')
+    lexicon = loadLexicon(os.path.join(tmp, 'index.bin'), cccantoFile, readingsFile)
+
+    # a simplified run merges into a simplified morpheme, with the traditional entries
+    merged = mergeDictionaryRuns([initMorpheme(h) for h in '广东话'], lexicon)
+    assert [m['hanzi'] for m in merged if not m['hidden']] == ['广东话'], merged
+    assert merged[0]['merged'] and merged[0]['cantoDefinitions'][0]['hanzi'] == '廣東話'
+
+    # the merged morpheme goes with the tokens after it, and the tokens place the breaks
+    text = '广东话\n\n话\n'
+    morphemes = merged + [initMorpheme(h) for h in '\n\n话\n']
+    split = splitParagraphs(text, morphemes)
+    assert [t for t, _ in split] == ['广东话\n\n', '话\n'], split
+    assert [m for _, ms in split for m in ms] == morphemes and split[1][1][0]['hanzi'] == '话'
+    # a token straddling a break keeps its paragraphs together
+    straddling = merged + [initMorpheme('\n\n话'), initMorpheme('\n')]
+    assert splitParagraphs(text, straddling) == [(text, straddling)]
+    for wrong in [morphemes[:-1], morphemes + [initMorpheme('\n')], merged[:1]]:
+      try:
+        splitParagraphs(text, wrong)
+        assert False, 'tokens that misspell the text should raise'
+      except ValueError:
+        pass
+
+    with Pipeline(lexicon, cacheFile=None, engine='dictionary') as pipeline:
+      oldText, newText = '廣東話\n\n話\n', '廣東話\n\n話話\n'
+      old = pipeline.parse(oldText)
+      assert old[0]['hanzi'] == '廣東話'
+      old[0]['reading'] = 'gwong2 dung1 waa6'  # as if chosen in the editor
+      new = pipeline.reparse(oldText, old, newText)
+      # the untouched paragraph keeps its edit, and the rest is as a full parse would give
+      expected = pipeline.parse(newText)
+      expected[0]['reading'] = 'gwong2 dung1 waa6'
+      assert new == expected, new
+      # morphemes that don't spell out the old text mean parsing everything afresh
+      assert pipeline.reparse(oldText + '話', old, newText) == pipeline.parse(newText)
+
+    # without blank lines, editing one line reparses just that line
+    profile = Profile()
+    with Pipeline(lexicon, cacheFile=None, profile=profile, engine='dictionary') as pipeline:
+      oldLines = [f'{i}話廣東話\n' for i in range(200)]
+      newLines = oldLines[:100] + ['100話广东话\n'] + oldLines[101:]
+      old = pipeline.parse(''.join(oldLines))
+      new = pipeline.reparse(''.join(oldLines), old, ''.join(newLines))
+      assert profile.counts['reused paragraphs'] == 199, profile.counts
+      assert profile.counts['reparsed paragraphs'] == 1, profile.counts
+      assert new == pipeline.parse(''.join(newLines))
+
+    lexicon.close()
 
 
 if __name__ == '__main__':
-  import json
-  import sys
+  import argparse
+
+  parser = argparse.ArgumentParser(
+      description="Analyze text on stdin (or in files), printing JSON morphemes")
+  parser.add_argument(
+      'inputs',
+      nargs='*',
+      help="text files, or directories of `.txt` files, to parse in parallel, each to a `.json` "
+      "file beside it. If none, read stdin")
+  parser.add_argument(
+      '-j', '--jobs', type=int, help="with inputs, number of worker processes (default: all cores)")
+  parser.add_argument('--out-dir', help="with inputs, write the `.json` files here instead")
+  parser.add_argument(
+      '--ndjson',
+      action='store_true',
+      help="stream: analyze stdin line by line (see `paragraphs`), printing each line's morphemes "
+      "as a JSON array on its own line as soon as it's ready")
+  parser.add_argument(
+      '--profile',
+      action='store_true',
+      help="print time spent per stage, and counts of lookups, cache hits, etc., to stderr")
+  parser.add_argument(
+      '--compact',
+      action='store_true',
+      help="store each dictionary entry once and refer to it by index (see `compact.py`)")
+  parser.add_argument(
+      '--previous-text',
+      help="incremental: the text stdin is an edited version of; with --previous-json, only "
+      "changed paragraphs are analyzed again")
+  parser.add_argument(
+      '--previous-json',
+      help="incremental: the JSON (full or compact) output for --previous-text, maybe edited since")
+  parser.add_argument(
+      '--engine',
+      choices=ENGINES,
+      default='analyzer',
+      help="segment with the Chinese analyzer (default), or quickly with just the dictionaries "
+      "(see `dictsegment.py`)")
+  parser.add_argument(
+      '--self-check', action='store_true', help="run quick self-checks, without the dictionaries")
+  args = parser.parse_args()
+  if args.self_check:
+    selfCheck()
+    print("Success!")
+    sys.exit()
+  if bool(args.previous_text) != bool(args.previous_json):
+    parser.error('--previous-text and --previous-json go together')
+
+  def output(morphemes: list[Morpheme]):
+    return compactMorphemes(morphemes) if args.compact else morphemes
+
+  profile = Profile() if args.profile else NULL_PROFILE
+
+  if args.inputs:
+    with profile.stage('total'):
+      done = parseFiles(
+          args.inputs,
+          jobs=args.jobs,
+          outDir=args.out_dir,
+          compact=args.compact,
+          engine=args.engine)
+    print(f"parsed {done} files", file=sys.stderr)
+  elif args.ndjson:
+    with Pipeline(profile=profile, engine=args.engine) as pipeline:
+      for morphemes in pipeline.parseMany(paragraphs(sys.stdin)):
+        print(json.dumps(output(morphemes)), flush=True)
+  elif args.previous_text:
+    with open(args.previous_text, 'r') as fid:
+      previousText = fid.read()
+    with open(args.previous_json, 'r') as fid:
+      previousMorphemes: list[Morpheme] = list(iterMorphemes(fid))  # type: ignore
+    stdin = sys.stdin.read()
+    with Pipeline(profile=profile, engine=args.engine) as pipeline:
+      morphemes = pipeline.reparse(previousText, previousMorphemes, stdin)
+    print(json.dumps(output(morphemes)))
+  else:
+    stdin = sys.stdin.read()
+    with Pipeline(profile=profile, engine=args.engine) as pipeline:
+      morphemes = pipeline.parse(stdin)
+    print(json.dumps(output(morphemes)))
 
-  stdin = sys.stdin.read()
-  morphemes = parseTextToMorphemes(stdin)
-  print(json.dumps(morphemes))
+  if profile.enabled:
+    print(profile.summary(), file=sys.stderr)
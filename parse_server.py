@@ -0,0 +1,183 @@
+"""
+A long-running local parse service
+
+`python parse.py` loads both dictionaries, a `ChineseAnalyzer` and the
+analysis cache from scratch every time it runs. This server keeps them all
+resident: POST text to `/parse` and get back its morphemes as JSON, just like
+`parse.py`'s output (add `?compact=1` for a `compact.CompactDocument`).
+
+Requests arriving at about the same time are coalesced into micro-batches (up
+to `BATCH_SIZE` texts, waiting at most `BATCH_WAIT` seconds for a batch to
+fill) by a `BatchingParser`. Each batch is looked up in the analysis cache,
+identical texts are parsed once, and the rest are spread over a
+`parse.workerPool`. Only the batching thread touches the cache.
+
+Usage:
+```
+python parse_server.py --port 5001 --jobs 4
+curl --data-binary @article.txt http://127.0.0.1:5001/parse
+```
+Measure it with `benchmarks/loadtest.py`.
+"""
+
+import concurrent.futures
+import queue
+import threading
+import time
+import typing
+from flask import Flask, abort, jsonify, request
+from cache_analysis import AnalysisCache
+from compact import compactMorphemes
+from parse import ANALYSIS_CACHE_DIR, ENGINES, Morpheme, parseInWorker, workerPool
+
+BATCH_SIZE = 32  # most texts to parse together
+BATCH_WAIT = 0.005  # seconds to wait for more texts once one has arrived
+JOBS: typing.Optional[int] = None  # worker processes, default: one per core
+
+Job = tuple[str, concurrent.futures.Future]
+
+
+class BatchingParser:
+  """Parses texts submitted from any thread, in micro-batches
+
+  A single background thread owns the analysis cache and a `parse.workerPool`:
+  it waits for a text, gathers whatever else arrives within `batchWait`
+  seconds (up to `batchSize` texts), and parses the batch in the pool. The
+  pool's `engine` is as in `parse.Pipeline`: the dictionary engine skips the
+  cache.
+  """
+
+  def __init__(self,
+               jobs: typing.Optional[int] = None,
+               cacheFile: typing.Optional[str] = ANALYSIS_CACHE_DIR,
+               batchSize: int = BATCH_SIZE,
+               batchWait: float = BATCH_WAIT,
+               engine: str = 'analyzer'):
+    self.cacheFile = cacheFile if engine == 'analyzer' else None
+    self.batchSize = batchSize
+    self.batchWait = batchWait
+    self.queue: queue.Queue[typing.Optional[Job]] = queue.Queue()
+    # start the workers before the cache is opened so they don't inherit its connection
+    self.pool = workerPool(jobs, engine)
+    self.thread = threading.Thread(target=self._run, name='BatchingParser', daemon=True)
+    self.thread.start()
+
+  def submit(self, text: str) -> concurrent.futures.Future:
+    "Queue `text` for parsing: the future's result will be its morphemes"
+    future: concurrent.futures.Future = concurrent.futures.Future()
+    self.queue.put((text, future))
+    return future
+
+  def parse(self, text: str) -> list[Morpheme]:
+    return self.submit(text).result()
+
+  def close(self):
+    "Finish queued texts, then stop the batching thread and the workers"
+    self.queue.put(None)
+    self.thread.join()
+    self.pool.close()
+    self.pool.join()
+
+  def _nextBatch(self) -> typing.Optional[list[Job]]:
+    "Block for one job, then take more until the batch is full or `batchWait` is up"
+    job = self.queue.get()
+    if job is None:
+      return None
+    batch = [job]
+    deadline = time.monotonic() + self.batchWait
+    while len(batch) < self.batchSize:
+      remaining = deadline - time.monotonic()
+      try:
+        job = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+      except queue.Empty:
+        break
+      if job is None:
+        self.queue.put(None)  # finish this batch, then stop
+        break
+      batch.append(job)
+    return batch
+
+  def _run(self):
+    cache = AnalysisCache(self.cacheFile, None) if self.cacheFile else None
+    try:
+      while True:
+        batch = self._nextBatch()
+        if batch is None:
+          return
+        try:
+          self._parseBatch(batch, cache)
+        except BaseException as e:
+          for _, future in batch:
+            if not future.done():
+              future.set_exception(e)
+    finally:
+      if cache:
+        cache.close()
+
+  def _parseBatch(self, batch: list[Job], cache: typing.Optional[AnalysisCache]):
+    texts = list(dict.fromkeys(text for text, _ in batch))
+    jobs = [(text, cache.getData(text) if cache else None) for text in texts]
+    results: dict[str, list[Morpheme]] = dict()
+    for text, (morphemes, fresh) in zip(texts, self.pool.map(parseInWorker, jobs)):
+      results[text] = morphemes
+      if cache and fresh is not None:
+        cache.setData(text, fresh)
+    if cache:
+      cache.flush()
+    for text, future in batch:
+      future.set_result(results[text])
+
+
+_parser: typing.Optional[BatchingParser] = None
+_parserLock = threading.Lock()
+
+
+def parser() -> BatchingParser:
+  "The server's `BatchingParser`, started on first use"
+  global _parser
+  with _parserLock:
+    if _parser is None:
+      _parser = BatchingParser(JOBS)
+    return _parser
+
+
+app = Flask(__name__)
+
+
+@app.route('/parse', methods=['POST'])
+def parse_text():
+  "Parse the request body (or the `text` of a JSON body) to morphemes"
+  if request.is_json:
+    body = request.get_json()
+    text = body.get('text') if isinstance(body, dict) else None
+    if not isinstance(text, str):
+      abort(400)
+  else:
+    text = request.get_data(as_text=True)
+  morphemes = parser().parse(text)
+  if request.args.get('compact'):
+    return jsonify(compactMorphemes(morphemes))
+  return jsonify(morphemes)
+
+
+if __name__ == '__main__':
+  import argparse
+
+  argparser = argparse.ArgumentParser(description="Serve parses over HTTP")
+  argparser.add_argument('--host', default='127.0.0.1')
+  argparser.add_argument('--port', type=int, default=5001)
+  argparser.add_argument(
+      '-j', '--jobs', type=int, help="number of worker processes (default: one per core)")
+  argparser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+  argparser.add_argument(
+      '--batch-wait', type=float, default=BATCH_WAIT, help="seconds to wait for a batch to fill")
+  argparser.add_argument(
+      '--engine', choices=ENGINES, default='analyzer', help="see `parse.py --engine`")
+  args = argparser.parse_args()
+
+  _parser = BatchingParser(
+      args.jobs, batchSize=args.batch_size, batchWait=args.batch_wait, engine=args.engine)
+  try:
+    app.run(host=args.host, port=args.port, threaded=True)
+  finally:
+    _parser.close()
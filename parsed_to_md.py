@@ -1,26 +1,53 @@
 import sys
 import json
-from parse import morphemeToBulletedDefs, morphemeToRuby, Morpheme
+import shutil
+import tempfile
+import typing
+from jsonstream import iterMorphemes
 from partition_by import partitionBy
+from render import morphemeToBulletedDefs, morphemeToRuby, Morpheme
 
-if __name__ == '__main__':
-  morphemes: list[Morpheme] = json.load(sys.stdin)
-  ruby = "".join(map(morphemeToRuby, morphemes))
-  print("# Readings as HTML")
-  print(ruby)
-
-  print("# Morphemes")
 
-  morphemesIter = iter(morphemes)
-  for line in partitionBy(lambda m: m['hanzi'] == '\n', morphemesIter):
+def morphemesToMarkdown(morphemes: typing.Iterable[Morpheme]) -> typing.Iterator[str]:
+  "Lazily render the per-line sections of the Markdown, one chunk at a time"
+  for line in partitionBy(lambda m: m['hanzi'] == '\n', iter(morphemes)):
     text = "".join(m['hanzi'] for m in line if not m['hidden'])
     if len(text.strip()) == 0:
       continue
-    print(f"## {text}")
+    yield f"## {text}"
     ruby = "".join(map(morphemeToRuby, line))
-    print(f'### {ruby}')
+    yield f'### {ruby}'
     for m in line:
       bullets = morphemeToBulletedDefs(m)
       if len(bullets):
-        print(bullets)
-    print(json.dumps(line, ensure_ascii=False))
+        yield bullets
+    yield json.dumps(line, ensure_ascii=False)
+
+
+def streamMarkdown(morphemes: typing.Iterable[Morpheme], out: typing.TextIO):
+  """Render morphemes to `out` as they're read
+
+  The readings section is written to `out` as each morpheme arrives, while the
+  per-line sections, which come after it, are spooled to a temporary file, so
+  with a lazy iterable (like `jsonstream.iterMorphemes`), memory use doesn't
+  grow with the document.
+  """
+
+  def printReadings() -> typing.Iterator[Morpheme]:
+    for m in morphemes:
+      out.write(morphemeToRuby(m))
+      yield m
+
+  print("# Readings as HTML", file=out)
+  with tempfile.TemporaryFile('w+', encoding='utf8') as spool:
+    for chunk in morphemesToMarkdown(printReadings()):
+      print(chunk, file=spool)
+    print(file=out)
+
+    print("# Morphemes", file=out)
+    spool.seek(0)
+    shutil.copyfileobj(spool, out)
+
+
+if __name__ == '__main__':
+  streamMarkdown(iterMorphemes(sys.stdin), sys.stdout)
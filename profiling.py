@@ -0,0 +1,122 @@
+"""
+Per-stage timing and counters for the parse pipeline
+
+Give a `Profile` to `parse.Pipeline` to find out where a slow parse spends its
+time: it adds up wall time per stage (analyzer, cache I/O, dictionary lookup,
+merging, guessing, …) and counts events (dictionary lookups, cache hits and
+misses, merges, guesses, word-fill calls). `Profile(onStage=...)` also calls
+back after each stage with its name and duration.
+
+The pipeline's default is `NULL_PROFILE`, whose methods do nothing and whose
+`enabled` is false, so code can skip any bookkeeping that isn't free.
+"""
+
+import collections
+import time
+import typing
+from lexicon import ANY_SOURCE, Hit, Lexicon
+
+StageCallback = typing.Callable[[str, float], None]
+
+
+class _Stage:
+  "Context manager timing one stage of a `Profile`"
+
+  def __init__(self, profile: 'Profile', name: str):
+    self.profile = profile
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+
+  def __exit__(self, *exc):
+    self.profile.addTime(self.name, time.perf_counter() - self.start)
+
+
+class Profile:
+  "Accumulates wall time per stage and counts of events"
+  enabled = True
+
+  def __init__(self, onStage: typing.Optional[StageCallback] = None):
+    self.seconds: dict[str, float] = collections.defaultdict(float)
+    self.counts: collections.Counter[str] = collections.Counter()
+    self.onStage = onStage
+
+  def stage(self, name: str) -> typing.ContextManager:
+    "Time the body of a `with` block as part of stage `name`"
+    return _Stage(self, name)
+
+  def addTime(self, name: str, seconds: float):
+    self.seconds[name] += seconds
+    if self.onStage:
+      self.onStage(name, seconds)
+
+  def count(self, name: str, n: int = 1):
+    self.counts[name] += n
+
+  def countLookups(self, lexicon: Lexicon, name: str) -> Lexicon:
+    "Wrap a lexicon so its `probe`s and `lookup`s are counted as `name`"
+    return CountingLexicon(lexicon, self, name)
+
+  def summary(self) -> str:
+    "Human-readable table of stage times and counters"
+    total = sum(self.seconds.values()) or 1.0
+    lines = ['stage                     seconds      %']
+    for name, seconds in sorted(self.seconds.items(), key=lambda kv: -kv[1]):
+      lines.append(f'{name:<20} {seconds:12.4f} {100 * seconds / total:6.1f}')
+    lines.append('counter                     count')
+    for name, count in sorted(self.counts.items()):
+      lines.append(f'{name:<20} {count:12d}')
+    return '\n'.join(lines)
+
+
+class _NullStage:
+
+  def __enter__(self):
+    pass
+
+  def __exit__(self, *exc):
+    pass
+
+
+class NullProfile(Profile):
+  "A `Profile` that records nothing, at next to no cost"
+  enabled = False
+  _stage = _NullStage()
+
+  def __init__(self):
+    super().__init__()
+
+  def stage(self, name: str) -> typing.ContextManager:
+    return self._stage
+
+  def addTime(self, name: str, seconds: float):
+    pass
+
+  def count(self, name: str, n: int = 1):
+    pass
+
+  def countLookups(self, lexicon: Lexicon, name: str) -> Lexicon:
+    return lexicon
+
+
+NULL_PROFILE = NullProfile()
+
+
+class CountingLexicon(Lexicon):
+  "A `Lexicon` that counts each `probe` and `lookup` into another one"
+
+  def __init__(self, lexicon: Lexicon, profile: Profile, name: str):
+    # shares `lexicon`'s store and entry cache rather than opening its own
+    self.store = lexicon.store
+    self.lexicon = lexicon
+    self.profile = profile
+    self.name = name
+
+  def probe(self, prefix: str, sources: int = ANY_SOURCE) -> tuple[bool, bool]:
+    self.profile.count(self.name)
+    return self.lexicon.probe(prefix, sources)
+
+  def lookup(self, word: str) -> Hit:
+    self.profile.count(self.name)
+    return self.lexicon.lookup(word)
@@ -18,12 +18,14 @@ hanzi, and its values are lists of entries, each entry consisting of
 The entries are in a *list* because the same hanzi can correspond to
 multiple readings.
 
-Caches the dict to JSON for faster loading.
+Entries are also indexed by simplified hanzi, where those differ, in a
+second dict.
+
+The parser doesn't load these dicts directly: they're compiled, with CC-Canto
+(see `cccanto`), into the prebuilt index it does load (see `lexicon.build`).
 """
 
 import typing
-import json
-import os.path
 
 
 class ReadingEntry(typing.TypedDict):
@@ -33,27 +35,23 @@ class ReadingEntry(typing.TypedDict):
 
 
 Hanzi = str
-CantoReadings = dict[Hanzi, list[ReadingEntry]]
+CantoReadings = typing.Mapping[Hanzi, list[ReadingEntry]]
 
 
-def init(file: str, jsonfile: typing.Optional[str] = None) -> CantoReadings:
-  """Loads the CC-Canto readings file for CC-Edict
+def parseFile(file: str) -> tuple[dict[Hanzi, list[ReadingEntry]], dict[Hanzi, list[ReadingEntry]]]:
+  """Parse the CC-Canto readings text file for CC-Edict into plain dicts
 
-  Currently this file has format "cccedict-canto-readings-NUMBERS.txt". A path
-  to such a file is needed for `file` argument. A JSON file will be saved to
-  `jsonfile` (defaults to `file + '.json'`).
+  Currently this file has format "cccedict-canto-readings-NUMBERS.txt". Returns
+  a dict keyed by traditional hanzi, and one mapping simplified hanzi to the
+  entries whose simplified form differs, sharing the same entry objects.
   """
-  jsonfile = jsonfile or (file + '.json')
-
-  if os.path.exists(jsonfile):
-    return json.load(open(jsonfile, 'r'))
-
-  d: CantoReadings = dict()
+  d: dict[Hanzi, list[ReadingEntry]] = dict()
+  simplified: dict[Hanzi, list[ReadingEntry]] = dict()
   with open(file, 'r') as fid:
     for line in fid.readlines():
       if line.startswith('#'):
         continue
-      trad, _, readings = line.strip().split(" ", 2)
+      trad, simp, readings = line.strip().split(" ", 2)
       mandarin, cantonese = readings.strip().split('] {')
       mandarin = mandarin.removeprefix('[')
       cantonese = cantonese.removesuffix('}')
@@ -62,14 +60,14 @@ def init(file: str, jsonfile: typing.Optional[str] = None) -> CantoReadings:
         d[trad].append(result)
       else:
         d[trad] = [result]
-  with open(jsonfile, 'w') as fid:
-    json.dump(d, fid)
+      if simp != trad:
+        simplified.setdefault(simp, []).append(result)
 
-  return d
+  return d, simplified
 
 
 if __name__ == '__main__':
-  d = init('cccedict-canto-readings-150923.txt')
+  d, _ = parseFile('cccedict-canto-readings-150923.txt')
   res = d['精神']
   print(res)
   assert len(res) == 2, "two readings for 精神"
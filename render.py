@@ -0,0 +1,153 @@
+"""
+Morphemes, and rendering them to HTML ruby and Markdown
+
+Everything that reads parsed JSON (`parsed_to_md.py`, `editor_server.py`)
+needs just these, not the parsing stack: importing this module loads no
+dictionaries and no Chinese analyzer, so rendering an existing document starts
+in milliseconds. `parse` re-exports all of it.
+"""
+
+import functools
+import itertools
+import re
+import typing
+from cccanto import CantoEntry
+from compact import Entry, resolveEntries
+from partition_by import partitionBy
+from readings import ReadingEntry
+
+
+class MorphemeFields(typing.TypedDict):
+  hanzi: str
+
+  # Jieba's hits per token, so at least 1, maybe more; all maybe None
+  pinyins: list[typing.Optional[str]]
+  definitions: list[typing.Optional[list[str]]]  # inner list: separate sub-meanings
+
+  cantoDefinitions: list[CantoEntry]  # matched by hanzi
+  cantoPinyins: list[ReadingEntry]  # also matched by hanzi but for comparison to pinyins
+  # N.B., len(cantoDefinitions) might be != len(cantoPinyins)!
+
+  merged: bool  # should default to false if from Jieba; when we create a new morpheme from multiple ones, set this to true
+  hidden: bool  # should default to false if from Jieba; when a merged morpheme overshadows a Jieba morpheme, hide the latter
+  guessed: bool  # should default to false if from Jieba
+
+
+class Morpheme(MorphemeFields, total=False):
+  reading: str  # Cantonese reading chosen by the user in the editor, overriding the inferred one
+
+
+TONE = re.compile('[0-9]$')
+RENDER_CACHE_SIZE = 1 << 16  # distinct readings and ruby strings to remember
+
+
+def splitTone(syllable: str) -> tuple[str, str]:
+  "`'gam3'` -> `('gam', '3')`; `'m'` -> `('m', '')`"
+  match = TONE.search(syllable)
+  if not match:
+    return syllable, ''
+  return syllable[:match.start()], syllable[match.start():]
+
+
+def cantoneseToHtml(c: str, prefix='', suffix='') -> str:
+  word, tone = splitTone(c)
+  if not tone:
+    return c
+  return f'{prefix}{word}<sup>{tone}{suffix}</sup>'
+
+
+class Resolution(typing.NamedTuple):
+  "Which Cantonese reading to show for a morpheme: see `resolveReading`"
+  reading: str  # the chosen reading, or 'unknown'
+  ambiguous: bool  # whether there were several candidate readings, or none
+  syllables: tuple[tuple[str, str], ...]  # `reading` split into syllables, each with `splitTone`
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def resolveReading(pinyins: frozenset[str], candidates: tuple[tuple[str, str], ...]) -> Resolution:
+  """Choose among `candidates`, a morpheme's (Mandarin, Cantonese) reading pairs
+
+  If the analyzer gave the morpheme any `pinyins`, only candidates with one of
+  those Mandarin readings count. Memoized, since the same words come up over
+  and over.
+  """
+  if pinyins:
+    cantos = set(canto for mandarin, canto in candidates if mandarin in pinyins)
+  else:
+    cantos = set(canto for _, canto in candidates)
+  reading = min(cantos, default='unknown')
+  return Resolution(reading, len(cantos) != 1, tuple(map(splitTone, reading.split(' '))))
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def resolutionToRuby(hanzi: str, resolution: Resolution, guessed: bool) -> str:
+  more = '<sup>+</sup>' if resolution.ambiguous else ''
+  guess = '¿' if guessed else ''
+  if len(resolution.syllables) == len(hanzi):
+    return "".join(f"<ruby>{h}<rt>{guess}{word}<sup>{tone}{more}</sup></rt></ruby>"
+                   if tone else f"<ruby>{h}<rt>{word}</rt></ruby>"
+                   for h, (word, tone) in zip(hanzi, resolution.syllables))
+
+  canto = resolution.reading.replace(' ', '')
+  return f'<ruby>{hanzi}<rt>{guess}{canto}{more}</rt></ruby>'
+
+
+def morphemeToRuby(m: Morpheme, entries: typing.Optional[list[Entry]] = None) -> str:
+  """HTML ruby markup of a morpheme's Cantonese reading
+
+  For a morpheme from a `compact.CompactDocument`, pass the document's
+  `entries` table.
+
+  The reading is chosen by `resolveReading` and marked up by
+  `resolutionToRuby`, both memoized on their inputs, so rendering the same
+  word again (as `parsed_to_md.py` and `morphemeToBulletedDefs` do) is a
+  couple of lookups.
+  """
+  if m['hidden']:
+    return ''
+  cantoDefinitions = resolveEntries(m['cantoDefinitions'], entries)
+  cantoPinyins = resolveEntries(m['cantoPinyins'], entries)
+  reading = m.get('reading')
+  if reading:
+    resolution = resolveReading(frozenset(), (('', reading),))
+  elif len(cantoDefinitions) == 0 and len(cantoPinyins) == 0:
+    return m['hanzi']
+  else:
+    candidates = itertools.chain(cantoDefinitions, cantoPinyins)
+    resolution = resolveReading(
+        frozenset(p for p in m['pinyins'] if p),
+        tuple((e['mandarin'], e['cantonese']) for e in candidates))
+  return resolutionToRuby(m['hanzi'], resolution, m['guessed'])
+
+
+def lenNotNone(l: list) -> int:
+  return sum(1 for x in l if x is not None)
+
+
+def morphemeToBulletedDefs(m: Morpheme, entries: typing.Optional[list[Entry]] = None) -> str:
+  "Markdown bullets of a morpheme's definitions; see `morphemeToRuby` about `entries`"
+  cantoDefinitions = resolveEntries(m['cantoDefinitions'], entries)
+  if m['hidden'] or (len(cantoDefinitions) == 0 and lenNotNone(m['definitions']) == 0):
+    return ''
+  markdown = f"- {morphemeToRuby(m, entries)}\n"
+  if len(cantoDefinitions):
+    sub = [f'  - {d["cantonese"]} : {d["definition"]}' for d in cantoDefinitions]
+  else:
+    sub = ['  - ' + " / ".join(d) for d in m['definitions'] if d is not None]
+  return markdown + '\n'.join(sub)
+
+
+def lineToMarkdown(line: list[Morpheme]) -> str:
+  "Markdown for one line of text: a heading of ruby, then its definitions"
+  text = "".join(map(morphemeToRuby, line))
+  if len(text.strip()) == 0:
+    return ''
+  # skip morphemes without bullets, so the definitions stay one list
+  defs = "\n".join(filter(None, (morphemeToBulletedDefs(m) for m in line)))
+  return f'\n## {text}\n{defs}'
+
+
+def pageMarkdown(morphemes: typing.Iterable[Morpheme]) -> str:
+  "Markdown for a document's page: each line of text's ruby and definitions"
+  lines = partitionBy(lambda m: m['hanzi'] == '\n', iter(morphemes))
+  return "\n".join(filter(None, map(lineToMarkdown, lines)))
@@ -1,44 +1,103 @@
+import typing
 from typing import Collection
 
 
-def fill(word: str, dictionary: Collection[str], alreadySorted: bool = False) -> list[str]:
-  """Greedy longest word-filling
+class PrefixIndex(typing.Protocol):
+  "Anything that can say whether a string is a word, and whether it begins any word"
+
+  def probe(self, prefix: str) -> tuple[bool, bool]:
+    ...
+
+
+class WordSet:
+  """In-memory `PrefixIndex` over a collection of words
+
+  Compiled indexes like `lexicon.Lexicon` already have `probe`, so this is
+  only needed for plain collections of words.
+  """
+
+  def __init__(self, words: Collection[str]):
+    self.words = set(words)
+    self.prefixes = {word[:i] for word in self.words for i in range(1, len(word) + 1)}
+
+  def probe(self, prefix: str) -> tuple[bool, bool]:
+    return (prefix in self.words, prefix in self.prefixes)
+
+
+class Segmenter:
+  """Reusable biggest-pieces word-filler over a fixed dictionary
+
+  Build once from a `PrefixIndex` (or any collection of words, which gets
+  wrapped in a `WordSet`), then call `segment` as often as needed.
+  """
+
+  def __init__(self, dictionary: typing.Union[PrefixIndex, Collection[str]]):
+    if not hasattr(dictionary, 'probe'):
+      dictionary = WordSet(dictionary)  # type: ignore
+    self.index: PrefixIndex = dictionary  # type: ignore
+
+  def segment(self, word: str, unknown: bool = False) -> list[str]:
+    """Split `word` into dictionary words, preferring the biggest pieces
+
+    Returns a list of dictionary words that, joined together, equal `word`.
+    Among all such lists, picks the one with the largest sum of squared piece
+    lengths (so bigger pieces win), then the one with the fewest pieces, then
+    the one whose earlier pieces are longer, like greedy leftmost-longest
+    filling (so "好食飯" over {"好", "好食", "食飯", "飯"} is "好食", "飯").
+
+    This is dynamic programming over positions in `word`, from the end back,
+    extending each piece only while it's still a prefix of some dictionary
+    word, so it costs O(len(word) × longest dictionary word) probes. It finds a
+    split whenever one exists, and raises `ValueError` only when the
+    dictionary cannot cover `word`.
+
+    With `unknown`, any single character may be a piece too, scoring nothing,
+    so there's always a split: dictionary words where possible, and single
+    characters in between.
+    """
+    n = len(word)
+    # best[start] scores the best split of word[start:]; ends[start] is where its first piece ends
+    best: list[typing.Optional[tuple[int, int]]] = [None] * (n + 1)
+    ends: list[int] = [n] * (n + 1)
+    best[n] = (0, 0)
+    for start in range(n - 1, -1, -1):
+      for end in range(start + 1, n + 1):
+        isWord, isPrefix = self.index.probe(word[start:end])
+        score = best[end]
+        if score is not None and (isWord or (unknown and end == start + 1)):
+          candidate = (score[0] + (end - start)**2 if isWord else score[0], score[1] - 1)
+          old = best[start]
+          # on ties, the longer first piece wins
+          if old is None or candidate >= old:
+            best[start] = candidate
+            ends[start] = end
+        if not isPrefix:
+          break
+
+    if best[0] is None:
+      raise ValueError("dictionary must cover input")
+    pieces: list[str] = []
+    start = 0
+    while start < n:
+      pieces.append(word[start:ends[start]])
+      start = ends[start]
+    return pieces
+
+
+def fill(word: str, dictionary: Collection[str]) -> list[str]:
+  """Biggest-pieces word-filling
 
   Given a `word` and a `dictionary` of words in your language (not a Python
   dict), returns a list of entries from the `dictionary` that when joined
   together, equal `word`, and moreover, the *biggest* words are chosen. That is,
   you can `assert word == "".join(fill(word, dictionary))`.
 
-  Raises when the `dictionary` cannot "cover" the `word`. Because the algorithm
-  is greedy, and simple, we don't backtrack to try to find a different way to
-  split the `word` that avoids dead-ends where the algorithm cannot advance
-  further. Therefore, an exception being raised does not mean that the word
-  can't be split with these dictionary entries, just that this simple algorithm
-  couldn't do it.
+  Raises when the `dictionary` cannot "cover" the `word`.
 
-  This will create a sorted copy of the `dictionary` unless `alreadySorted=True`
-  is passed in.
+  To fill many words from the same dictionary, build a `Segmenter` once
+  instead.
   """
-  return _worker(word, dictionary if alreadySorted else sorted(dictionary, key=len, reverse=True))
-
-
-def _worker(s: str, dsort: Collection[str]):
-  "Recursively split s"
-  for word in dsort:
-    if word in s:
-      left, right = s.split(word, maxsplit=1)
-      # use maxsplit to ensure only left/right instead of more than two chunks
-      # if this word appears in the string multiple times to simplify the code
-      # below, instead of dealing with interleaving `s`.
-
-      ret: list[str] = []
-      if len(left):
-        ret.extend(_worker(left, dsort))
-      ret.append(word)
-      if len(right):
-        ret.extend(_worker(right, dsort))
-      return ret
-  raise ValueError("dictionary must cover input")
+  return Segmenter(dictionary).segment(word)
 
 
 if __name__ == '__main__':
@@ -51,4 +110,16 @@ if __name__ == '__main__':
   assert (fill(word, myset) == expected)
   assert (fill(word, mylist) == expected)
   assert (fill(word, mydict) == expected)
+
+  # a greedy filler would take "bcd" first and then dead-end on "a"
+  assert (fill("abcde", {"bcd", "ab", "cd", "e"}) == ["ab", "cd", "e"])
+  # ties go to the longer earlier piece, as greedy filling did
+  assert fill('好食飯', {'好', '好食', '食飯', '飯'}) == ['好食', '飯']
+  assert Segmenter({"barry", "butt"}).segment(
+      "barrybutton", unknown=True) == ["barry", "butt", "o", "n"]
+  try:
+    fill("barrybutton", {"barry", "butt"})
+    assert False, "should have raised"
+  except ValueError:
+    pass
   print("Success!")